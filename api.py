@@ -1,19 +1,121 @@
 from functools import wraps
+import hashlib
 import logging
+import threading
 import time
 import uuid
 import tailwind
-from battleship.server import GameServer, StateUpdater, has_joined, is_finished, is_started
-from flask import Flask, make_response, render_template, request, url_for
+from battleship.bot import choose_target
+from battleship.hub import GameHub
+from battleship.metrics import Metrics
+from battleship.model import Game, Vector
+from battleship.pool import BoardPool
+from battleship.server import GameServer, StateUpdater, create_board, has_joined, is_finished, is_started
+from flask import Flask, g, make_response, render_template, request, stream_template, url_for
+from markupsafe import Markup
 
-from battleship.view import View
+from battleship.view import FragmentCache, LazyPlayerView, View, is_stale
 
 
-def configure_routing(app: Flask, updater: StateUpdater):
+# Long polls are answered after at most this many seconds, rechecking storage for moves made by other processes
+LONG_POLL_TIMEOUT = 20
+LONG_POLL_RECHECK = 5
+# Each waiting long poll holds a worker thread, so past this many (FLASK_LONG_POLL_WAITERS) polls are answered at once
+LONG_POLL_WAITERS = 16
+
+# Streamed pages are flushed in chunks of about this many characters, rather than one write per template node
+STREAM_BUFFER = 16 * 1024
+
+
+def buffered(chunks, size: int = STREAM_BUFFER):
+    buffer, length = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer, length = [], 0
+    
+    if buffer:
+        yield ''.join(buffer)
+
+
+def version_tag(updated: float, player: str, *extra) -> str:
+    # Rendered game pages depend only on the game version, the viewer's seat and whether the game is stale
+    key = ':'.join(map(str, [repr(updated), player, is_stale(updated), *extra]))
+    return hashlib.sha1(key.encode()).hexdigest()[:20]
+
+
+def poll_tag(updated: float, player: str, busy: bool = False) -> str:
+    # Interval polls keep the backoff of the copy they revalidate, so only the version and seat are tagged.
+    # A busy answer switches the client to interval polls, so it must not revalidate as a long poll
+    return version_tag(updated, player, *(['busy'] if busy else []))
+
+
+def poll_context(state: Game, busy: bool = False) -> dict:
+    # Interval polls carry no since, so the client's next poll after a busy answer tries to long poll again
+    context = {'long_poll': False} if busy else {}
+    return {**context, 'interval': 0.5*round(time.time() - state.updated)}
+
+
+def page(state: Game) -> str:
+    ''' Page shown at a game's URL: the join form until both seats are taken '''
+    return 'join' if not is_finished(state) and not is_started(state) else 'state'
+
+
+def parse_target(args) -> tuple[int, Vector]:
+    ''' Board and position fired at, from the query string of a target request '''
+    return int(args.get('board')), (int(args.get('x')), int(args.get('y')))
+
+
+def configure_metrics(app: Flask, metrics: Metrics, fragments: FragmentCache, pool: BoardPool = None):
+    ''' Time every request and serve metrics as Prometheus text on /metrics '''
+    metrics.watch('fragments', fragments)
+    if pool:
+        metrics.watch('boards', pool)
+
+    @app.before_request
+    def start_timer():
+        g.started = time.perf_counter()
+
+    @app.after_request
+    def record_latency(response):
+        # Streamed bodies are rendered after this returns, so the request is timed until the server closes it
+        started, rule, method = g.started, request.url_rule, request.method
+        route = rule.rule if rule else 'unmatched'
+        response.call_on_close(lambda: metrics.requests.observe(time.perf_counter() - started, method, route, response.status_code))
+        return response
+
+    @app.get('/metrics')
+    def export_metrics():
+        return metrics.render(), {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
+def configure_routing(app: Flask, updater: StateUpdater, pool: BoardPool = None, hub: GameHub = None, fragments: FragmentCache = None,
+                      metrics: Metrics = None):
     logger = app.logger
     logger.setLevel(logging.INFO)
-    server = GameServer(updater, logger)
+    server = GameServer(updater, logger, pool.take if pool else create_board, hub, metrics=metrics, bot=choose_target)
     view = View(tailwind.config)
+    app.jinja_env.globals['long_poll'] = hub is not None
+    waiting = threading.BoundedSemaphore(app.config.get('LONG_POLL_WAITERS', LONG_POLL_WAITERS))
+    fragments = fragments or FragmentCache()
+    if metrics:
+        configure_metrics(app, metrics, fragments, pool)
+    for name in app.jinja_env.list_templates(filter_func=lambda name: name.endswith('.html')):
+        # Compile up front so no request pays for it
+        app.jinja_env.get_template(name)
+
+    def stream(template: str, **context):
+        return buffered(stream_template(template, **context))
+
+    @app.template_global()
+    def board_fragment(game: str, b: int, player: LazyPlayerView):
+        # Every viewer with the same view of the same game version gets the same board HTML
+        return fragments.get(
+            (game, *player.key),
+            lambda: Markup(render_template('components/board.html', game=game, b=b, player=player))
+        )
 
     def get_cookie(key):
         def decorator(func):
@@ -40,6 +142,19 @@ def configure_routing(app: Flask, updater: StateUpdater):
         
         return decorator
 
+    def not_modified(tag: str):
+        if tag in request.if_none_match:
+            response = make_response('', 304)
+            response.set_etag(tag)
+            return response
+
+    def tagged(body, tag: str):
+        response = make_response(body)
+        response.set_etag(tag)
+        # Browsers revalidate every request, and serve their cached copy to HTMX on 304
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
     @app.get('/')
     @set_cookie('player-id', lambda: str(uuid.uuid4()))
     def lobby(_):
@@ -47,7 +162,8 @@ def configure_routing(app: Flask, updater: StateUpdater):
     
     @app.post('/')
     def create():
-        game = server.new_game()
+        # Single-player games seat the computer before anyone joins
+        game = server.new_game(bot='bot' in request.form)
         
         response = make_response()
         response.headers.add_header('HX-Redirect', url_for('game', game=game))
@@ -56,12 +172,17 @@ def configure_routing(app: Flask, updater: StateUpdater):
     @app.get('/games/<game>')
     @set_cookie('player-id', lambda: str(uuid.uuid4()))
     def game(player, game):
+        # Revalidations only need the timestamp to be answered when unchanged. Other requests read the game once
+        if request.if_none_match and (response := not_modified(version_tag(server.updated(game), player))):
+            return response
+
         state = server.get(game)
-        if not is_finished(state) and not is_started(state):
+        tag = version_tag(state.updated, player)
+        if page(state) == 'join':
             logger.info("Game %s has not started, player %s to join", game, player)
-            return render_template('index.html', page='join', game=game)
+            return tagged(render_template('index.html', page='join', game=game), tag)
         else:
-            return render_template('index.html', page='state', game=game, **view.render(state, player))
+            return tagged(stream('index.html', page='state', game=game, **view.render(state, player)), tag)
         
     @app.get('/games/<game>/join')
     @get_cookie('player-id')
@@ -80,25 +201,49 @@ def configure_routing(app: Flask, updater: StateUpdater):
         if not is_started(state):
             return render_template('components/join.html', game=game)
         else:
-            return render_template('components/state.html', game=game, **view.render(state, player))
+            return stream('components/state.html', game=game, **view.render(state, player))
     
     @app.get('/games/<game>/poll')
     @get_cookie('player-id')
     def poll(player, game):
+        since = request.args.get('since', type=float)
+        long_poll = hub and since is not None
+        busy = False
+        # Long polls and revalidations check the timestamp first. Other polls read the game once
+        if long_poll or request.if_none_match:
+            updated = server.updated(game)
+            if long_poll and updated <= since:
+                busy = not waiting.acquire(blocking=False)
+                if not busy:
+                    try:
+                        deadline = time.monotonic() + LONG_POLL_TIMEOUT
+                        while updated <= since and (remaining := deadline - time.monotonic()) > 0:
+                            # Only the timestamp is reread, whether woken by a move here or rechecking for one elsewhere
+                            hub.wait(game, since, min(remaining, LONG_POLL_RECHECK))
+                            updated = server.updated(game)
+                    finally:
+                        waiting.release()
+
+            if response := not_modified(poll_tag(updated, player, busy)):
+                if metrics:
+                    metrics.polls.inc('not_modified')
+                return response
+
         state = server.get(game)
-        age = time.time() - state.updated
-        logger.info('Player %s polling: game %s last updated %s s ago', player, game, age)
-        return render_template('htmx/poll.html', game=game, interval=0.5*round(age), **view.render(state, player))
+        if metrics:
+            metrics.polls.inc('busy' if busy else 'changed')
+        logger.info('Player %s polling: game %s last updated %s s ago', player, game, time.time() - state.updated)
+        body = stream('htmx/poll.html', game=game, **poll_context(state, busy), **view.render(state, player))
+        return tagged(body, poll_tag(state.updated, player, busy))
     
     @app.post('/games/<game>/target')
     @get_cookie('player-id')
     def target(player, game):
         state = server.get(game)
-        board = int(request.args.get('board'))
-        position = int(request.args.get('x')), int(request.args.get('y'))
+        board, position = parse_target(request.args)
         if state.players[board].id != player:
-            state = server.target(game, board, position)
+            state = server.target(game, board, position, state=state)
             
-        return render_template('components/state.html', game=game, **view.render(state, player))
+        return stream('components/state.html', game=game, **view.render(state, player))
     
     return app
@@ -1,15 +1,91 @@
 from threading import Thread
 from api import configure_routing
+from battleship.hub import GameHub
+from battleship.metrics import Metrics
+from battleship.pool import BoardPool
+from battleship.server import StateUpdater, create_board
 from flask import Flask
 
+from storage.archive import Archive
+from storage.cache import CachingUpdater
+from storage.events import EventUpdater
+from storage.journal import JournalUpdater
+from storage.metered import MeteredUpdater
+from storage.retention import FileLease, RetentionPolicy, Sweeper
+from storage.sqlite import SqliteUpdater
+from storage.tiered import TieredUpdater
 from storage.tinydb import TinyDbUpdater, UpdateListener
 
 
-def create_app():
-    ''' Default factory method for Flask CLI runner '''
-    app = Flask(__name__)
+def create_updater(app: Flask) -> StateUpdater:
+    ''' Local storage backend, chosen by the FLASK_STORAGE environment variable '''
+    storage = app.config.get('STORAGE', 'tinydb')
+    if storage == 'journal':
+        updater = JournalUpdater(app.logger, 'json/games.log')
+        Thread(target=updater.run, daemon=True).start()
+        return updater
+    elif storage == 'events':
+        updater = EventUpdater(app.logger, 'json/events.log')
+        Thread(target=updater.run, daemon=True).start()
+        return updater
+    elif storage == 'sqlite':
+        return SqliteUpdater('json/games.db')
+    
     listener = UpdateListener(app.logger)
     thread = Thread(target=listener.run, daemon=True)
     thread.start()
 
-    return configure_routing(app, TinyDbUpdater(listener, 'json/games.json'))
+    return TinyDbUpdater(listener, 'json/games.json')
+
+
+def create_tier(app, backend: StateUpdater) -> StateUpdater:
+    '''
+    In-memory tier over backend: a read cache by default, or with FLASK_TIERED the authoritative copy, written back
+    every FLASK_FLUSH_INTERVAL seconds. Only for a single instance, as other instances would not see its writes.
+    '''
+    if not app.config.get('TIERED'):
+        return CachingUpdater(backend)
+
+    updater = TieredUpdater(
+        backend,
+        app.logger,
+        size=app.config.get('TIERED_SIZE', 4096),
+        interval=app.config.get('FLUSH_INTERVAL', 1.0)
+    )
+    Thread(target=updater.run, daemon=True).start()
+    return updater
+
+
+def start_sweeper(app, backend: StateUpdater, tier: StateUpdater, archive: str = None) -> Sweeper:
+    '''
+    Sweep old games in the background, configured by FLASK_RETENTION (policy as JSON) and FLASK_RETENTION_INTERVAL.
+    Games are read from backend and deleted through tier, and one process per host sweeps
+    '''
+    sweeper = Sweeper(
+        backend,
+        app.logger,
+        Archive(archive) if archive else None,
+        RetentionPolicy(**app.config.get('RETENTION', {})),
+        interval=app.config.get('RETENTION_INTERVAL', 3600.0),
+        cache=tier,
+        lease=FileLease('json/sweeper.lock')
+    )
+    Thread(target=sweeper.run, daemon=True).start()
+    return sweeper
+
+
+def create_app():
+    ''' Default factory method for Flask CLI runner '''
+    app = Flask(__name__)
+    app.config.from_prefixed_env()
+
+    pool = BoardPool(create_board, app.logger)
+    Thread(target=pool.run, daemon=True).start()
+
+    metrics = Metrics()
+    backend = MeteredUpdater(create_updater(app), metrics)
+    updater = create_tier(app, backend)
+    metrics.watch('games', updater)
+    start_sweeper(app, backend, updater, 'json/archive.jsonl.gz')
+
+    return configure_routing(app, updater, pool, GameHub(), metrics=metrics)
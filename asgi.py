@@ -0,0 +1,29 @@
+from threading import Thread
+from app import create_tier, create_updater, start_sweeper
+from async_api import configure_routing
+from battleship.async_server import AsyncGameHub
+from battleship.metrics import Metrics
+from battleship.pool import BoardPool
+from battleship.server import create_board
+from quart import Quart
+
+from storage.executor import ExecutorUpdater
+from storage.metered import MeteredUpdater
+
+
+def create_app():
+    ''' Factory for ASGI servers, e.g. hypercorn 'asgi:create_app()', using the same local storage as app.create_app '''
+    app = Quart(__name__)
+    # Same FLASK_ settings as the WSGI app
+    app.config.from_prefixed_env('FLASK')
+
+    pool = BoardPool(create_board, app.logger)
+    Thread(target=pool.run, daemon=True).start()
+
+    metrics = Metrics()
+    backend = MeteredUpdater(create_updater(app), metrics)
+    updater = create_tier(app, backend)
+    metrics.watch('games', updater)
+    start_sweeper(app, backend, updater, 'json/archive.jsonl.gz')
+
+    return configure_routing(app, ExecutorUpdater(updater), pool, AsyncGameHub(), metrics=metrics)
@@ -0,0 +1,217 @@
+from functools import wraps
+import logging
+import time
+import uuid
+import tailwind
+from api import LONG_POLL_RECHECK, LONG_POLL_TIMEOUT, STREAM_BUFFER, page, parse_target, poll_context, poll_tag, version_tag
+from battleship.async_server import AsyncGameHub, AsyncGameServer, AsyncStateUpdater
+from battleship.bot import choose_target
+from battleship.metrics import Metrics
+from battleship.pool import BoardPool
+from battleship.server import create_board, is_started
+from markupsafe import Markup
+from quart import Quart, g, make_response, render_template, request, stream_template, url_for
+
+from battleship.view import FragmentCache, LazyPlayerView, View
+
+
+async def buffered(chunks, size: int = STREAM_BUFFER):
+    buffer, length = [], 0
+    async for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer, length = [], 0
+
+    if buffer:
+        yield ''.join(buffer)
+
+
+class TimedBody:
+    ''' Response body calling record once the server has sent all of it '''
+    def __init__(self, body, record):
+        self.body = body
+        self.record = record
+
+    async def __aenter__(self):
+        return await self.body.__aenter__()
+
+    async def __aexit__(self, *exc):
+        try:
+            return await self.body.__aexit__(*exc)
+        finally:
+            self.record()
+
+
+def configure_metrics(app: Quart, metrics: Metrics, fragments: FragmentCache, pool: BoardPool = None):
+    ''' The metrics of api.configure_metrics, for the async app '''
+    metrics.watch('fragments', fragments)
+    if pool:
+        metrics.watch('boards', pool)
+
+    @app.before_request
+    async def start_timer():
+        g.started = time.perf_counter()
+
+    @app.after_request
+    async def record_latency(response):
+        started, rule, method = g.started, request.url_rule, request.method
+        route = rule.rule if rule else 'unmatched'
+        response.response = TimedBody(
+            response.response,
+            lambda: metrics.requests.observe(time.perf_counter() - started, method, route, response.status_code)
+        )
+        return response
+
+    @app.get('/metrics')
+    async def export_metrics():
+        return metrics.render(), {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
+def configure_routing(app: Quart, updater: AsyncStateUpdater, pool: BoardPool = None, hub: AsyncGameHub = None, fragments: FragmentCache = None,
+                      metrics: Metrics = None):
+    ''' The routes of api.configure_routing as async views, for serving from one event loop under ASGI '''
+    logger = app.logger
+    logger.setLevel(logging.INFO)
+    server = AsyncGameServer(updater, logger, pool.take if pool else create_board, hub, metrics=metrics, bot=choose_target)
+    view = View(tailwind.config)
+    app.jinja_env.globals['long_poll'] = hub is not None
+    fragments = fragments or FragmentCache()
+    if metrics:
+        configure_metrics(app, metrics, fragments, pool)
+
+    async def stream(template: str, **context):
+        return buffered(await stream_template(template, **context))
+
+    @app.template_global()
+    async def board_fragment(game: str, b: int, player: LazyPlayerView):
+        key = game, *player.key
+        fragment = fragments.lookup(key)
+        if fragment is None:
+            fragment = fragments.store(key, Markup(await render_template('components/board.html', game=game, b=b, player=player)))
+
+        return fragment
+
+    def get_cookie(key):
+        def decorator(func):
+            @wraps(func)
+            async def inner(*args, **kwargs):
+                cookie = request.cookies.get(key)
+                return await func(cookie, *args, **kwargs)
+
+            return inner
+
+        return decorator
+
+    def set_cookie(key, factory):
+        def decorator(func):
+            @wraps(func)
+            async def inner(*args, **kwargs):
+                cookie = request.cookies.get(key)
+                value = cookie if cookie else factory()
+                response = await make_response(await func(value, *args, **kwargs))
+                response.set_cookie(key, value)
+                return response
+
+            return inner
+
+        return decorator
+
+    async def not_modified(tag: str):
+        if tag in request.if_none_match:
+            response = await make_response('', 304)
+            response.set_etag(tag)
+            return response
+
+    async def tagged(body, tag: str):
+        response = await make_response(body)
+        response.set_etag(tag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    @app.get('/')
+    @set_cookie('player-id', lambda: str(uuid.uuid4()))
+    async def lobby(_):
+        return await render_template('index.html', page='create')
+
+    @app.post('/')
+    async def create():
+        game = await server.new_game(bot='bot' in await request.form)
+
+        response = await make_response('')
+        response.headers['HX-Redirect'] = url_for('game', game=game)
+        return response
+
+    @app.get('/games/<game>')
+    @set_cookie('player-id', lambda: str(uuid.uuid4()))
+    async def game(player, game):
+        # Revalidations only need the timestamp to be answered when unchanged. Other requests read the game once
+        if request.if_none_match and (response := await not_modified(version_tag(await server.updated(game), player))):
+            return response
+
+        state = await server.get(game)
+        tag = version_tag(state.updated, player)
+        if page(state) == 'join':
+            logger.info("Game %s has not started, player %s to join", game, player)
+            return await tagged(await render_template('index.html', page='join', game=game), tag)
+        else:
+            return await tagged(await stream('index.html', page='state', game=game, **view.render(state, player)), tag)
+
+    @app.get('/games/<game>/join')
+    @get_cookie('player-id')
+    async def load_join(player, game):
+        state = await server.get(game)
+        return await render_template('htmx/join.html', game=game, **view.render(state, player))
+
+    @app.post('/games/<game>')
+    @get_cookie('player-id')
+    async def join(player, game):
+        name = (await request.form)['player-name']
+        if not name:
+            return await render_template('htmx/join.html', game=game, validation={'name_empty': True})
+
+        state = await server.join(game, player, name)
+        if not is_started(state):
+            return await render_template('components/join.html', game=game)
+        else:
+            return await stream('components/state.html', game=game, **view.render(state, player))
+
+    @app.get('/games/<game>/poll')
+    @get_cookie('player-id')
+    async def poll(player, game):
+        since = request.args.get('since', type=float)
+        long_poll = hub and since is not None
+        # Long polls and revalidations check the timestamp first. Other polls read the game once
+        if long_poll or request.if_none_match:
+            updated = await server.updated(game)
+            if long_poll:
+                # A waiting poll is a suspended coroutine, not a thread, so a process can hold thousands
+                deadline = time.monotonic() + LONG_POLL_TIMEOUT
+                while updated <= since and (remaining := deadline - time.monotonic()) > 0:
+                    await hub.wait(game, since, min(remaining, LONG_POLL_RECHECK))
+                    updated = await server.updated(game)
+
+            if response := await not_modified(poll_tag(updated, player)):
+                if metrics:
+                    metrics.polls.inc('not_modified')
+                return response
+
+        state = await server.get(game)
+        if metrics:
+            metrics.polls.inc('changed')
+        logger.info('Player %s polling: game %s last updated %s s ago', player, game, time.time() - state.updated)
+        body = await stream('htmx/poll.html', game=game, **poll_context(state), **view.render(state, player))
+        return await tagged(body, poll_tag(state.updated, player))
+
+    @app.post('/games/<game>/target')
+    @get_cookie('player-id')
+    async def target(player, game):
+        state = await server.get(game)
+        board, position = parse_target(request.args)
+        if state.players[board].id != player:
+            state = await server.target(game, board, position, state=state)
+
+        return await stream('components/state.html', game=game, **view.render(state, player))
+
+    return app
@@ -0,0 +1,160 @@
+from abc import ABC, abstractmethod
+from functools import wraps
+import asyncio
+from collections import OrderedDict
+import time
+
+from battleship.metrics import Metrics
+from battleship.model import Game, Vector
+from battleship.server import Change, ConflictException, GameServerBase, create_board, try_join, try_target
+
+
+class AsyncStateUpdater(ABC):
+    ''' StateUpdater for asyncio: the same contract, with every call awaited '''
+    @abstractmethod
+    async def exists(self, id: str) -> bool:
+        pass
+
+    @abstractmethod
+    async def get(self, id: str) -> Game:
+        pass
+
+    @abstractmethod
+    async def insert(self, game: Game) -> str:
+        pass
+
+    @abstractmethod
+    async def update(self, game: Game, id: str, changes: list[Change] = None, expected_version: int = None) -> Game:
+        pass
+
+    async def updated(self, id: str) -> float:
+        return (await self.get(id)).updated
+
+
+class AsyncGameHub:
+    '''
+    GameHub for a single event loop: waiters are suspended coroutines rather than blocked threads,
+    so thousands of polls can wait at once. Publish from the loop's thread.
+    '''
+    def __init__(self, size: int = 4096):
+        self.size = size
+        self.versions = OrderedDict()
+        # Each game's pending event is set and replaced on publish, and dropped with its last waiter
+        self.events = {}
+        self.waiters = {}
+
+    def publish(self, id: str, updated: float):
+        self.versions[id] = updated
+        self.versions.move_to_end(id)
+        while len(self.versions) > self.size:
+            self.versions.popitem(last=False)
+
+        if id in self.events:
+            self.events.pop(id).set()
+
+    async def published(self, id: str, since: float):
+        while self.versions.get(id, since) <= since:
+            await self.events.setdefault(id, asyncio.Event()).wait()
+
+    async def wait(self, id: str, since: float, timeout: float) -> bool:
+        ''' Wait until game id is published past since, or timeout seconds pass '''
+        if self.versions.get(id, since) > since:
+            return True
+
+        self.waiters[id] = self.waiters.get(id, 0) + 1
+        try:
+            # wait_for rather than asyncio.timeout, which needs Python 3.11
+            await asyncio.wait_for(self.published(id, since), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.waiters[id] -= 1
+            if not self.waiters[id]:
+                del self.waiters[id]
+                self.events.pop(id, None)
+
+
+class AsyncGameServer(GameServerBase):
+    ''' GameServer for asyncio, applying the same rules with storage calls awaited '''
+    def __init__(self, games: AsyncStateUpdater, logger, boards=create_board, hub: AsyncGameHub = None, retries: int = 8,
+                 metrics: Metrics = None, bot=None):
+        super().__init__(games, logger, boards, hub, retries, metrics, bot)
+
+    def log(func):
+        @wraps(func)
+        async def inner(self: 'AsyncGameServer', *args, **kwargs):
+            logger = self.logger
+            result = await func(self, *args, **kwargs)
+            logger.debug('Called method %s (args %s kwargs %s), got result %s', func.__name__, args, kwargs, result)
+
+            return result
+
+        return inner
+
+    def timed(func):
+        @wraps(func)
+        async def inner(self: 'AsyncGameServer', *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(self, *args, **kwargs)
+            finally:
+                self.observe(func.__name__, start)
+
+        return inner
+
+    def update_state(func):
+        @wraps(func)
+        async def inner(self: 'AsyncGameServer', id: str, *args, **kwargs):
+            for attempt in range(self.retries + 1):
+                game, changes = await func(self, id, *args, **kwargs)
+                if not changes:
+                    return game
+
+                try:
+                    game = await self.games.update(game, id, changes, game.version - 1)
+                    break
+                except ConflictException:
+                    if not self.conflicted(id, func.__name__, attempt):
+                        raise
+
+                    kwargs['state'] = None
+
+            self.committed(id, game)
+            return game
+
+        return inner
+
+    @timed
+    @log
+    async def exists(self, game: str) -> bool:
+        return await self.games.exists(game)
+
+    @timed
+    @log
+    async def get(self, game: str) -> Game:
+        return await self.games.get(game)
+
+    @timed
+    @log
+    async def updated(self, game: str) -> float:
+        return await self.games.updated(game)
+
+    @timed
+    @log
+    async def new_game(self, bot: bool = False) -> str:
+        return await self.games.insert(self.new_state(bot))
+
+    @timed
+    @update_state
+    @log
+    async def join(self, game: str, player: str, name: str, state: Game = None) -> tuple[Game, list[Change]]:
+        state = state or await self.games.get(game)
+        return self.reply(try_join(state, player, name, self.boards, time.time()))
+
+    @timed
+    @update_state
+    @log
+    async def target(self, game: str, board: int, position: Vector, state: Game = None) -> tuple[Game, list[Change]]:
+        state = state or await self.games.get(game)
+        return self.reply(try_target(state, board, position, time.time()))
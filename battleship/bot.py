@@ -0,0 +1,103 @@
+from functools import cache
+import random
+
+from battleship.model import BitBoard, ShipType, Vector
+from battleship.placement import placement_table
+from battleship.server import ships
+
+
+@cache
+def segments(width: int, height: int, length: int) -> tuple[int, ...]:
+    ''' Mask of every distinct placement of a ship of length: the placement table lists most of them once per end '''
+    return tuple(sorted({mask for _, _, mask in placement_table(width, height).candidates(length)}))
+
+
+def add(counts: list[int], mask: int, times: int = 1):
+    '''
+    Add times to the count of every cell in mask. counts is bit-sliced: bit i of counts[k] is bit k of cell i's count,
+    so one ripple-carry addition updates every cell of the board at once
+    '''
+    for _ in range(times):
+        carry = mask
+        for k in range(len(counts)):
+            counts[k], carry = counts[k] ^ carry, counts[k] & carry
+            if not carry:
+                break
+        else:
+            counts.append(carry)
+
+
+def densest(counts: list[int], cells: int) -> int:
+    ''' Mask of the cells among cells with the highest count, by narrowing from the most significant slice down '''
+    for bits in reversed(counts):
+        if cells & bits:
+            cells &= bits
+
+    return cells
+
+
+def wrecks(board: BitBoard, sunk: list[ShipType]) -> int:
+    '''
+    Cells known to belong to sunk ships. Players are told which types sank but not where, so these are the hits
+    covered by every way of fitting the sunk ships, without overlap, into the hits
+    '''
+    hits = board.pegs & board.occupied
+    candidates = [[mask for mask in segments(board.width, board.height, ships[type]) if mask & hits == mask]
+                  for type in sorted(sunk, key=ships.get, reverse=True)]
+    known = None
+
+    def fit(i: int, taken: int):
+        nonlocal known
+        if i == len(candidates):
+            known = taken if known is None else known & taken
+            return
+        for mask in candidates[i]:
+            if not mask & taken:
+                fit(i + 1, taken | mask)
+
+    fit(0, 0)
+    return known or 0
+
+
+def tally(board: BitBoard, lengths, hits: int, blocked: int) -> list[int]:
+    counts = []
+    for length in lengths:
+        for mask in segments(board.width, board.height, length):
+            if mask & blocked:
+                continue
+            if not hits:
+                add(counts, mask)
+            elif explained := (mask & hits).bit_count():
+                add(counts, mask, explained)
+
+    return counts
+
+
+def heatmap(board: BitBoard, sunk: list[ShipType]) -> list[int]:
+    '''
+    Bit-sliced count, per cell, of the placements of the ships still afloat that fit what the shooter has seen.
+    While hits are unaccounted for by sunk ships (target mode) only placements through them count, once per hit
+    they explain; otherwise (hunt mode) every placement clear of misses and sunk ships counts once.
+    '''
+    misses = board.pegs & ~board.occupied
+    wrecked = wrecks(board, sunk)
+    hits = board.pegs & board.occupied & ~wrecked
+
+    afloat = dict(ships)
+    for type in sunk:
+        afloat.pop(type, None)
+
+    counts = tally(board, afloat.values(), hits, misses | wrecked)
+    if hits and not counts:
+        # No ship afloat fits through the hits left, so sunk ships took them in a way the shooter cannot tell
+        counts = tally(board, afloat.values(), 0, misses | hits)
+
+    return counts
+
+
+def choose_target(board: BitBoard, sunk: list[ShipType], rng: random.Random = random) -> Vector:
+    ''' Hunt/target strategy: fire at one of the untargeted cells most likely to hold a ship '''
+    untargeted = ~board.pegs & ((1 << board.width*board.height) - 1)
+    best = densest(heatmap(board, sunk), untargeted) or untargeted
+    index = rng.choice([i for i in range(board.width*board.height) if best >> i & 1])
+    return index % board.width, index // board.width
@@ -0,0 +1,43 @@
+from collections import OrderedDict
+import threading
+
+
+class GameHub:
+    '''
+    In-process publish/subscribe of game versions (their updated timestamps).
+    Only moves committed by this process are seen, so waiters should still recheck storage.
+    '''
+    def __init__(self, size: int = 4096):
+        self.size = size
+        self.lock = threading.Lock()
+        self.versions = OrderedDict()
+        self.waiting = {}
+
+    def publish(self, id: str, updated: float):
+        with self.lock:
+            self.versions[id] = updated
+            self.versions.move_to_end(id)
+            while len(self.versions) > self.size:
+                self.versions.popitem(last=False)
+            
+            if id in self.waiting:
+                condition, _ = self.waiting[id]
+                condition.notify_all()
+
+    def wait(self, id: str, since: float, timeout: float) -> bool:
+        ''' Block until game id is published past since, or timeout seconds pass '''
+        with self.lock:
+            condition, count = self.waiting.get(id, (None, 0))
+            if condition is None:
+                condition = threading.Condition(self.lock)
+            self.waiting[id] = condition, count + 1
+
+            try:
+                return condition.wait_for(lambda: self.versions.get(id, since) > since, timeout)
+            finally:
+                condition, count = self.waiting[id]
+                if count == 1:
+                    del self.waiting[id]
+                else:
+                    self.waiting[id] = condition, count - 1
+
@@ -0,0 +1,159 @@
+from bisect import bisect_left
+import threading
+import time
+
+
+# Upper bounds in seconds, from a cache hit to a long poll
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names: tuple[str, ...], values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *values, amount: float = 1):
+        with self.lock:
+            self.values[values] = self.values.get(values, 0) + amount
+
+    def samples(self) -> list[str]:
+        with self.lock:
+            values = list(self.values.items())
+
+        return [f'{self.name}{format_labels(self.labels, key)} {value}' for key, value in values]
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # Label values to per bucket counts, the last for values beyond every bucket, then sum
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, *values):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(values)
+            if counts is None:
+                counts = self.values[values] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def samples(self) -> list[str]:
+        with self.lock:
+            values = [(key, list(counts)) for key, counts in self.values.items()]
+
+        lines = []
+        for key, counts in values:
+            total = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                total += count
+                le = f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{format_labels(self.labels, key, le)} {total}')
+            lines.append(f'{self.name}_sum{format_labels(self.labels, key)} {counts[-1]}')
+            lines.append(f'{self.name}_count{format_labels(self.labels, key)} {total}')
+
+        return lines
+
+
+class Sampled:
+    ''' Gauge, or counter kept elsewhere, read when scraped from a callback per set of label values '''
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), type: str = 'gauge'):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.type = type
+        self.callbacks = {}
+
+    def set_function(self, func, *values):
+        self.callbacks[values] = func
+
+    def samples(self) -> list[str]:
+        return [f'{self.name}{format_labels(self.labels, key)} {func()}' for key, func in list(self.callbacks.items())]
+
+
+def size(stats: dict) -> int:
+    # Pools report the boards they hold as available
+    return stats.get('size', stats.get('available'))
+
+
+class ActiveGames:
+    ''' Games with a move in the last window seconds '''
+    def __init__(self, window: float = 300.0):
+        self.window = window
+        self.moved = {}
+        self.lock = threading.Lock()
+
+    def touch(self, id: str):
+        with self.lock:
+            self.moved[id] = time.monotonic()
+
+    def count(self) -> int:
+        cutoff = time.monotonic() - self.window
+        with self.lock:
+            for id in [id for id, moved in self.moved.items() if moved < cutoff]:
+                del self.moved[id]
+
+            return len(self.moved)
+
+
+class Metrics:
+    '''
+    Counters and latency histograms for requests, GameServer calls and storage calls, exposed as Prometheus text.
+    Recording a value takes a lock and a dict lookup, so these stay on in production.
+    '''
+    def __init__(self, window: float = 300.0):
+        self.metrics = []
+        self.requests = self.add(Histogram('battleship_request_seconds', 'Request latency, to the end of any streamed body',
+                                           ('method', 'route', 'status')))
+        self.calls = self.add(Histogram('battleship_server_seconds', 'GameServer method latency', ('method',)))
+        self.storage = self.add(Histogram('battleship_storage_seconds', 'StateUpdater call latency', ('backend', 'call')))
+        self.errors = self.add(Counter('battleship_storage_errors_total', 'Failed StateUpdater calls', ('backend', 'call', 'error')))
+        self.conflicts = self.add(Counter('battleship_conflicts_total', 'Moves retried after a conflicting write', ('method',)))
+        self.polls = self.add(Counter('battleship_polls_total', 'Polls by whether the game had changed, busy if answered at once for want of a long poll slot', ('result',)))
+        self.active = ActiveGames(window)
+        active = self.add(Sampled('battleship_active_games', f'Games with a move in the last {window:g} s'))
+        active.set_function(self.active.count)
+        self.lookups = self.add(Sampled('battleship_cache_lookups_total', 'Cache and pool lookups by result', ('cache', 'result'), 'counter'))
+        self.sizes = self.add(Sampled('battleship_cache_size', 'Entries held by each cache and pool', ('cache',)))
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def watch(self, cache: str, source):
+        ''' Report hits, misses and size from source.stats(), e.g. a CachingUpdater, FragmentCache or BoardPool '''
+        self.lookups.set_function(lambda: source.stats()['hits'], cache, 'hit')
+        self.lookups.set_function(lambda: source.stats()['misses'], cache, 'miss')
+        self.sizes.set_function(lambda: size(source.stats()), cache)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.samples())
+
+        return '\n'.join(lines) + '\n'
@@ -1,6 +1,8 @@
 
 from dataclasses import dataclass
 from enum import Enum
+from functools import reduce
+from operator import or_
 
 
 class ShipType(Enum):
@@ -13,6 +15,11 @@ class ShipType(Enum):
 
 Vector = tuple[int, int]
 
+# Every bearing a ship can have, in the order tile codes count them
+BEARINGS = ((-1, 0), (0, -1), (1, 0), (0, 1))
+# Tile codes leave room for ships up to this long
+MAX_LENGTH = 8
+
 @dataclass
 class Ship:
     type: ShipType
@@ -20,6 +27,17 @@ class Ship:
     offset: int
 
 
+def tile_code(ship: Ship) -> int:
+    ''' Small int for how a cell looks: 0 without a ship, otherwise set by the ship's type, bearing and offset '''
+    if ship is None:
+        return 0
+
+    return 1 + ((ship.type.value - 1) * len(BEARINGS) + BEARINGS.index(ship.bearing)) * MAX_LENGTH + ship.offset
+
+
+TILE_CODES = 1 + len(ShipType) * len(BEARINGS) * MAX_LENGTH
+
+
 @dataclass
 class Status:
     ship: Ship
@@ -29,11 +47,136 @@ class Status:
 Board = list[list[Status]]
 
 
+@dataclass(frozen=True)
+class Placement:
+    type: ShipType
+    origin: Vector
+    bearing: Vector
+    length: int
+
+    def cells(self) -> list[Vector]:
+        x0, y0 = self.origin
+        vx, vy = self.bearing
+        return [(x0+i*vx, y0+i*vy) for i in range(self.length)]
+
+
+class BitBoard:
+    ''' Compact board: ship occupancy and pegs are bitmasks indexed by y * width + x '''
+    __slots__ = ('width', 'height', 'fleet', 'masks', 'occupied', 'pegs', '_layout', '_tiles')
+
+    def __init__(self, width: int = 10, height: int = 10, fleet: tuple[Placement, ...] = (), pegs: int = 0, masks: tuple[int, ...] = None):
+        self.width = width
+        self.height = height
+        self.fleet = tuple(fleet)
+        self.masks = tuple(masks) if masks is not None else tuple(self.mask(p) for p in self.fleet)
+        self.occupied = reduce(or_, self.masks, 0)
+        self.pegs = pegs
+        self._layout = None
+        self._tiles = None
+
+    def bit(self, position: Vector) -> int:
+        x, y = position
+        return 1 << (y*self.width + x)
+
+    def mask(self, placement: Placement) -> int:
+        return reduce(or_, map(self.bit, placement.cells()), 0)
+
+    def copy(self) -> 'BitBoard':
+        board = BitBoard(self.width, self.height, self.fleet, self.pegs, self.masks)
+        board._layout = self._layout
+        board._tiles = self._tiles
+        return board
+
+    def place(self, placement: Placement) -> 'BitBoard':
+        return BitBoard(self.width, self.height, self.fleet + (placement,), self.pegs, self.masks + (self.mask(placement),))
+
+    def ship_index(self, position: Vector) -> int:
+        bit = self.bit(position)
+        for i, mask in enumerate(self.masks):
+            if mask & bit:
+                return i
+
+    def ship_at(self, position: Vector) -> Ship:
+        x, y = position
+        return self.layout()[y*self.width + x]
+
+    def is_pegged(self, position: Vector) -> bool:
+        return bool(self.pegs & self.bit(position))
+
+    def target(self, position: Vector):
+        self.pegs |= self.bit(position)
+
+    def is_sunk(self, index: int) -> bool:
+        mask = self.masks[index]
+        return self.pegs & mask == mask
+
+    def layout(self) -> list[Ship]:
+        ''' Flat row-major list of ship views, None for empty cells. Cached, as the fleet never changes '''
+        if self._layout is None:
+            layout = [None] * (self.width*self.height)
+            for placement in self.fleet:
+                for offset, (x, y) in enumerate(placement.cells()):
+                    layout[y*self.width + x] = Ship(type=placement.type, bearing=placement.bearing, offset=offset)
+            self._layout = layout
+
+        return self._layout
+
+    def tiles(self) -> list[int]:
+        ''' Flat row-major list of each cell's tile code, cached with the layout '''
+        if self._tiles is None:
+            self._tiles = [tile_code(ship) for ship in self.layout()]
+
+        return self._tiles
+
+    def cells(self) -> list[list[tuple[Ship, bool]]]:
+        layout, pegs, width = self.layout(), self.pegs, self.width
+        return [
+            [(layout[i], bool(pegs >> i & 1)) for i in range(y*width, (y+1)*width)]
+            for y in range(self.height)
+        ]
+
+    def rows(self) -> Board:
+        ''' Legacy view of this board as Status rows '''
+        return [[Status(ship=ship, peg=peg) for ship, peg in row] for row in self.cells()]
+
+    @classmethod
+    def from_rows(cls, rows: Board) -> 'BitBoard':
+        return cls.from_cells([[(status.ship, status.peg) for status in row] for row in rows])
+
+    @classmethod
+    def from_cells(cls, cells: list[list[tuple[Ship, bool]]]) -> 'BitBoard':
+        # Recover each ship's origin from any of its cells, so partial ships survive the conversion
+        lengths = {}
+        pegs = 0
+        width = len(cells[0]) if cells else 0
+        for y, row in enumerate(cells):
+            for x, (ship, peg) in enumerate(row):
+                if peg:
+                    pegs |= 1 << (y*width + x)
+
+                if ship:
+                    vx, vy = ship.bearing
+                    key = ship.type, (x - vx*ship.offset, y - vy*ship.offset), ship.bearing
+                    lengths[key] = max(lengths.get(key, 0), ship.offset + 1)
+
+        fleet = tuple(Placement(type, origin, bearing, length) for (type, origin, bearing), length in lengths.items())
+        return cls(width, len(cells), fleet, pegs)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, BitBoard):
+            return NotImplemented
+        
+        return (self.width, self.height, self.pegs, self.layout()) == (other.width, other.height, other.pegs, other.layout())
+
+    def __repr__(self) -> str:
+        return f'BitBoard(width={self.width}, height={self.height}, fleet={self.fleet}, pegs={self.pegs:#x})'
+
+
 @dataclass
 class Player:
     id: str
     name: str
-    board: Board
+    board: BitBoard
     sunk: list[ShipType]
 
 
@@ -57,3 +200,7 @@ class Game:
     updated: float
     finished: bool = False
     message: Message = None
+    # Incremented by every stored change, so writers can detect that a game changed since they read it
+    version: int = 0
+    # The computer's shot in answer to the move in message, in single-player games
+    reply: Message = None
@@ -0,0 +1,106 @@
+from functools import cache
+import random
+import time
+
+from battleship.model import BitBoard, Placement, ShipType, Vector
+
+
+directions = [(-1, 0), (0, -1), (1, 0), (0, 1)]
+
+ShipPrototype = tuple[ShipType, int]
+
+Candidate = tuple[Vector, Vector, int]
+
+
+def in_bounds(width: int, height: int, length: int, position: Vector, direction: Vector) -> bool:
+    x0, y0 = position
+    vx, vy = direction
+    return 0 <= y0+length*vy < height and 0 <= x0+length*vx < width
+
+
+class PlacementTable:
+    ''' Every legal (origin, bearing, mask) for each ship length on a board of the given size '''
+    attempts = 8
+
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.board = BitBoard(width, height)
+        self.tables = {}
+
+    def candidates(self, length: int) -> list[Candidate]:
+        if length not in self.tables:
+            self.tables[length] = [
+                ((x, y), direction, self.board.mask(Placement(None, (x, y), direction, length)))
+                for y in range(self.height)
+                for x in range(self.width)
+                for direction in directions
+                if in_bounds(self.width, self.height, length, (x, y), direction)
+            ]
+
+        return self.tables[length]
+
+    def generate(self, board: BitBoard, ships: list[ShipPrototype]) -> BitBoard:
+        '''
+        Sample each ship uniformly from the placements left free by earlier ships.
+        Returns None if some ship has nowhere left to go.
+        '''
+        occupied = board.occupied
+        fleet = list(board.fleet)
+        masks = list(board.masks)
+        for type, length in ships:
+            candidates = self.candidates(length)
+            if not candidates:
+                return None
+
+            for _ in range(self.attempts):
+                origin, bearing, mask = random.choice(candidates)
+                if not mask & occupied:
+                    break
+            else:
+                # Crowded board: draw from the remaining placements directly, which is uniform over the same set
+                options = [c for c in candidates if not c[2] & occupied]
+                if not options:
+                    return None
+
+                origin, bearing, mask = random.choice(options)
+
+            occupied |= mask
+            masks.append(mask)
+            fleet.append(Placement(type=type, origin=origin, bearing=bearing, length=length))
+
+        return BitBoard(board.width, board.height, fleet, board.pegs, masks)
+
+
+@cache
+def placement_table(width: int, height: int) -> PlacementTable:
+    return PlacementTable(width, height)
+
+
+def placement_rate(setup, ships: list[ShipPrototype], duration: float = 1.0) -> float:
+    ''' Ship placements per second achieved by setup(ships) over roughly the given duration '''
+    boards = 0
+    start = time.perf_counter()
+    while (elapsed := time.perf_counter() - start) < duration:
+        setup(ships)
+        boards += 1
+
+    return boards * len(ships) / elapsed
+
+
+if __name__ == '__main__':
+    from battleship.server import generate_direction, generate_position, new_board, ships, try_add_ship
+
+    def retry(ships: list[ShipPrototype]):
+        board = new_board()
+        for ship in ships:
+            while (placed := try_add_ship(board, ship, generate_position(board), generate_direction())) is board:
+                pass
+            board = placed
+
+        return board
+
+    fleet = list(ships.items())
+    table = placement_table(10, 10)
+    for name, setup in [('random retry', retry), ('placement table', lambda s: table.generate(new_board(), s))]:
+        print(f'{name}: {placement_rate(setup, fleet):,.0f} placements/s')
@@ -0,0 +1,59 @@
+from collections import deque
+import threading
+
+from battleship.model import BitBoard
+
+
+class BoardPool:
+    ''' Bounded stock of ready-made boards, topped up by a background worker running run() '''
+    def __init__(self, factory, logger, size: int = 64, low: int = 16, high: int = None):
+        self.factory = factory
+        self.logger = logger
+        self.size = size
+        self.low = low
+        self.high = size if high is None else min(high, size)
+        self.boards = deque()
+        self.hits = 0
+        self.misses = 0
+        self.refill = threading.Condition()
+        self.running = True
+
+    def take(self) -> BitBoard:
+        with self.refill:
+            if self.boards:
+                self.hits += 1
+                board = self.boards.popleft()
+            else:
+                self.misses += 1
+                board = None
+
+            if len(self.boards) < self.low:
+                self.refill.notify()
+
+        # Generate outside the lock so a miss never blocks other requests on the worker
+        return board if board is not None else self.factory()
+
+    def stats(self) -> dict:
+        with self.refill:
+            return {'available': len(self.boards), 'hits': self.hits, 'misses': self.misses}
+
+    def stop(self):
+        with self.refill:
+            self.running = False
+            self.refill.notify()
+
+    def run(self):
+        self.logger.info('Filling board pool to %s boards...', self.high)
+        while True:
+            with self.refill:
+                self.refill.wait_for(lambda: not self.running or len(self.boards) < self.low or not self.boards)
+                if not self.running:
+                    return
+                
+                missing = self.high - len(self.boards)
+
+            boards = [self.factory() for _ in range(missing)]
+            with self.refill:
+                self.boards.extend(boards[:self.size - len(self.boards)])
+                self.refill.notify_all()
+                self.logger.debug('Board pool refilled with %s boards', len(boards))
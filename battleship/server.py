@@ -1,8 +1,13 @@
 from abc import ABC, abstractmethod
+from functools import wraps
 import random
 import time
+from typing import Iterable
 
-from battleship.model import Board, Game, Message, Player, Result, Ship, ShipType, Status, Vector
+from battleship.hub import GameHub
+from battleship.metrics import Metrics
+from battleship.model import BitBoard, Game, Message, Placement, Player, Result, ShipType, Vector
+from battleship.placement import ShipPrototype, in_bounds, placement_table
 
 
 ships = {
@@ -14,6 +19,30 @@ ships = {
 }
 
 
+# Player id of the computer opponent in single-player games
+BOT = 'bot'
+
+# Path to a changed field of a serialized game, e.g. ('players', 1, 'board', 'pegs')
+Change = tuple[str | int, ...]
+
+
+def covers(prefix: Change, change: Change) -> bool:
+    return change[:len(prefix)] == prefix
+
+
+def merge(pending: list[Change], changes: list[Change]) -> list[Change]:
+    ''' Union of two change sets, without any path under another, as Firestore rejects overlapping field paths '''
+    if pending is None or changes is None:
+        return None
+
+    merged = list(pending)
+    for change in changes:
+        if not any(covers(path, change) for path in merged):
+            merged = [path for path in merged if not covers(change, path)] + [change]
+
+    return merged
+
+
 class StateUpdater(ABC):
     @abstractmethod
     def exists(self, id: str) -> bool:
@@ -28,19 +57,37 @@ class StateUpdater(ABC):
         pass
 
     @abstractmethod
-    def update(self, game: Game, id: str) -> Game:
+    def update(self, game: Game, id: str, changes: list[Change] = None, expected_version: int = None) -> Game:
+        '''
+        Store game under id. changes lists the fields that differ from the stored copy, if known.
+        If expected_version is given, raise ConflictException unless the stored game still has that version
+        '''
+        pass
+
+    def updated(self, id: str) -> float:
+        ''' Timestamp of the stored game, for cheap freshness checks. Backends may avoid a full read '''
+        return self.get(id).updated
+
+    @abstractmethod
+    def updated_before(self, timestamp: float) -> Iterable[str]:
+        ''' Ids of games last updated before timestamp, for retention sweeps '''
+        pass
+
+    @abstractmethod
+    def delete(self, id: str, expected_version: int = None):
+        ''' Remove game id. If expected_version is given, raise ConflictException unless the stored game has that version '''
         pass
 
 
-def new_board() -> Board:
+def new_board() -> BitBoard:
     width = 10
     height = 10
-    return Board([[Status(ship=None, peg=False) for _ in range(width)] for _ in range(height)])
+    return BitBoard(width, height)
 
 
-def generate_position(board: Board) -> Vector:
-    row = random.randint(0, len(board) - 1)
-    col = random.randint(0, len(board[0]) - 1)
+def generate_position(board: BitBoard) -> Vector:
+    row = random.randint(0, board.height - 1)
+    col = random.randint(0, board.width - 1)
     return col, row
 
 
@@ -50,51 +97,33 @@ def generate_direction() -> Vector:
     return total if not odd else 0, total if odd else 0
 
 
-ShipPrototype = tuple[Ship, int]
-
-
-def try_add_ship(board: Board, ship: ShipPrototype, position: Vector, direction: Vector) -> Board:
+def try_add_ship(board: BitBoard, ship: ShipPrototype, position: Vector, direction: Vector) -> BitBoard:
     type, length = ship
-    x0, y0 = position
-    vx, vy = direction
-    if not (0 <= y0+length*vy < len(board)):
-        return board
-    
-    if not (0 <= x0+length*vx < len(board[0])):
+    if not in_bounds(board.width, board.height, length, position, direction):
         return board
 
-    new_board = list(map(list, board))
-    for i in range(length):
-        row = new_board[y0+i*vy]
-        x = x0+i*vx
-        if row[x].ship is not None:
-            return board
-        
-        row[x] = Status(ship=Ship(type=type, bearing=direction, offset=i), peg=False)
+    placement = Placement(type=type, origin=position, bearing=direction, length=length)
+    if board.mask(placement) & board.occupied:
+        return board
 
-    return new_board
+    return board.place(placement)
 
 
 class InitializationException(Exception):
     pass
 
 
-def setup_board(board: Board, ships: list[ShipPrototype]):
-    def add_ship(board: Board, ship: ShipPrototype):
-        for _ in range(100):
-            # This function is random and not guaranteed to succeed. Limit iterations
-            position = generate_position(board)
-            direction = generate_direction()
-            new_board = try_add_ship(board, ship, position, direction)
-            if new_board != board:
-                return new_board
-        
+class ConflictException(Exception):
+    ''' The stored game changed since it was read '''
+    pass
+
+
+def setup_board(board: BitBoard, ships: list[ShipPrototype]):
+    new_board = placement_table(board.width, board.height).generate(board, ships)
+    if new_board is None:
+        # Only possible when the fleet cannot fit on the board at all
         raise InitializationException('Could not initialize board as requested')
     
-    new_board = board
-    for ship in ships:
-        new_board = add_ship(new_board, ship)
-    
     return new_board
 
 
@@ -127,24 +156,20 @@ def can_move(state: Game, viewer: str) -> bool:
     return has_joined(state, viewer) and viewer == get_player(state).id
 
 
+def bot_to_move(state: Game) -> bool:
+    return is_started(state) and not state.finished and get_player(state).id == BOT
+
+
 def has_won(player: Player) -> bool:
     return len(player.sunk) == len(ships)
 
 
-def is_sunk(board: Board, position: Vector) -> bool:
-    px, py = position
-    status = board[py][px]
-    ship = status.ship
-    if not ship:
+def is_sunk(board: BitBoard, position: Vector) -> bool:
+    index = board.ship_index(position)
+    if index is None:
         return False
     
-    vx, vy = ship.bearing
-    ox, oy = px - vx * ship.offset, py - vy * ship.offset
-    for i in range(ships[ship.type]):
-        if not board[vy*i+oy][vx*i+ox].peg:
-            return False
-        
-    return True
+    return board.is_sunk(index)
 
 
 def message(player: Player, result: Result):
@@ -155,12 +180,135 @@ def message(player: Player, result: Result):
         return Message(result=result)
 
 
-class GameServer:
-    def __init__(self, games: StateUpdater, logger):
+def add_player(state: Game, player: Player, updated: float) -> tuple[Game, list[Change]]:
+    ''' Seat player in the next free place '''
+    players = state.players
+    return Game(**{
+        **vars(state),
+        'updated': updated,
+        'version': state.version + 1,
+        'players': players + [player]
+    }), [('players', len(players)), ('updated',), ('version',)]
+
+
+def apply_target(state: Game, board: int, position: Vector, updated: float) -> tuple[Game, list[Change]]:
+    ''' Current player fires at position on the given board. Pegs and sunk lists are updated in place '''
+    changes = [('players', board, 'board', 'pegs'), ('player',), ('message',), ('finished',), ('updated',), ('version',)]
+    players = state.players
+    player = players[state.player]
+    opponent = players[board]
+    board = opponent.board
+    board.target(position)
+    
+    if state.reply:
+        changes.append(('reply',))
+    if is_sunk(board, position):
+        result = Result.SINK
+        player.sunk.append(board.ship_at(position).type)
+        changes.append(('players', state.player, 'sunk'))
+    elif board.ship_at(position):
+        result = Result.HIT
+    else:
+        result = Result.MISS
+
+    return Game(
+        player=next_player(state),
+        players=players,
+        message=message(player, result),
+        finished=has_won(player),
+        updated=updated,
+        version=state.version + 1
+    ), changes
+
+
+def try_join(state: Game, player: str, name: str, boards, updated: float) -> tuple[Game, list[Change]]:
+    ''' Seat player with a board from boards() if there is a free seat and they have not joined '''
+    if len(state.players) < 2 and not has_joined(state, player):
+        return add_player(state, Player(id=player, name=name, board=boards(), sunk=[]), updated)
+    
+    return state, []
+
+
+def try_target(state: Game, board: int, position: Vector, updated: float) -> tuple[Game, list[Change]]:
+    if state.finished or board == state.player:
+        # Only the player to move fires, and only at the other board: a retried move may no longer apply
+        return state, []
+    
+    return apply_target(state, board, position, updated)
+
+
+def apply_reply(state: Game, position: Vector, version: int) -> tuple[Game, list[Change]]:
+    ''' The computer fires at position, keeping the result of the move before it in message '''
+    game, changes = apply_target(state, next_player(state), position, state.updated)
+    return Game(**{**vars(game), 'message': state.message, 'reply': game.message, 'version': version}), changes + [('reply',)]
+
+
+def with_reply(state: Game, changes: list[Change], bot) -> tuple[Game, list[Change]]:
+    '''
+    Follow a move with the computer's, if it is its turn, so both are stored in one write: the version advances
+    once, message keeps the result of the move and reply holds the computer's
+    '''
+    if not bot_to_move(state):
+        return state, changes
+
+    position = bot(state.players[next_player(state)].board, get_player(state).sunk)
+    # Counted as one change on top of the stored game, unless it had been left with the computer to move
+    game, reply = apply_reply(state, position, state.version if changes else state.version + 1)
+    # A join's seat covers the computer's pegs on it
+    return game, merge(changes, reply)
+
+
+class GameServerBase:
+    '''
+    Moves and bookkeeping shared by GameServer and AsyncGameServer, which only differ in how storage is called.
+    bot, given a board and the ship types its shooter has sunk, chooses where the computer fires in single-player games
+    '''
+    def __init__(self, games, logger, boards=create_board, hub=None, retries: int = 8, metrics: Metrics = None, bot=None):
         self.games = games
         self.logger = logger
+        self.boards = boards
+        self.hub = hub
+        self.retries = retries
+        self.metrics = metrics
+        self.bot = bot
+
+    def observe(self, name: str, start: float):
+        if self.metrics:
+            self.metrics.calls.observe(time.perf_counter() - start, name)
+
+    def conflicted(self, id: str, name: str, attempt: int) -> bool:
+        ''' Record a write lost to a concurrent one, returning whether to retry it '''
+        if attempt == self.retries:
+            return False
+
+        self.logger.info('Game %s changed during %s, retrying', id, name)
+        if self.metrics:
+            self.metrics.conflicts.inc(name)
+        return True
+
+    def committed(self, id: str, game: Game):
+        if self.hub:
+            self.hub.publish(id, game.updated)
+        if self.metrics:
+            self.metrics.active.touch(id)
+
+    def new_state(self, bot: bool) -> Game:
+        # The computer takes the first seat, so it fires first once its opponent joins
+        players = [Player(id=BOT, name='computer', board=self.boards(), sunk=[])] if bot and self.bot else []
+        return Game(player=0, players=players, updated=time.time())
+
+    def reply(self, move: tuple[Game, list[Change]]) -> tuple[Game, list[Change]]:
+        return with_reply(*move, self.bot) if self.bot else move
+
+
+class GameServer(GameServerBase):
+    ''' Applies moves to stored games. The computer moves as soon as it is its turn, in the same write as the move before '''
+    def __init__(self, games: StateUpdater, logger, boards=create_board, hub: GameHub = None, retries: int = 8,
+                 metrics: Metrics = None, bot=None):
+        super().__init__(games, logger, boards, hub, retries, metrics, bot)
 
     def log(func):
+        @wraps(func)
         def inner(self: 'GameServer', *args, **kwargs):
             logger = self.logger
             result = func(self, *args, **kwargs)
@@ -170,7 +318,19 @@ class GameServer:
         
         return inner
 
+    def timed(func):
+        @wraps(func)
+        def inner(self: 'GameServer', *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(self, *args, **kwargs)
+            finally:
+                self.observe(func.__name__, start)
+
+        return inner
+
     def insert_state(func):
+        @wraps(func)
         def inner(self: 'GameServer', *args, **kwargs):
             game = func(self, *args, **kwargs)
             return self.games.insert(game)
@@ -178,63 +338,59 @@ class GameServer:
         return inner
     
     def update_state(func):
+        @wraps(func)
         def inner(self: 'GameServer', id: str, *args, **kwargs):
-            update = func(self, id, *args, **kwargs)
-            if update:
-                return self.games.update(update, id)
-            else:
-                return self.games.get(id)
+            for attempt in range(self.retries + 1):
+                game, changes = func(self, id, *args, **kwargs)
+                if not changes:
+                    return game
+                
+                try:
+                    # Every change increments the version, so the write only succeeds against the state it was based on
+                    game = self.games.update(game, id, changes, game.version - 1)
+                    break
+                except ConflictException:
+                    if not self.conflicted(id, func.__name__, attempt):
+                        raise
+
+                    kwargs['state'] = None
+            
+            self.committed(id, game)
+            return game
         
         return inner
-    
+
+    @timed
     @log
     def exists(self, game: str) -> bool:
         return self.games.exists(game)
     
+    @timed
     @log
     def get(self, game: str) -> Game:
         return self.games.get(game)
 
+    @timed
+    @log
+    def updated(self, game: str) -> float:
+        return self.games.updated(game)
+
+    @timed
     @insert_state
     @log
-    def new_game(self) -> str:
-        return Game(player=0, players=[], updated=time.time())
+    def new_game(self, bot: bool = False) -> str:
+        return self.new_state(bot)
     
+    @timed
     @update_state
     @log
-    def join(self, game: str, player: str, name: str) -> Game:
-        state = self.games.get(game)
-        players = state.players
-        if len(players) < 2 and not has_joined(state, player):
-            return Game(**{
-                **vars(state),
-                'updated': time.time(),
-                'players': players + [Player(id=player, name=name, board=create_board(), sunk=[])]
-            })
+    def join(self, game: str, player: str, name: str, state: Game = None) -> tuple[Game, list[Change]]:
+        state = state or self.games.get(game)
+        return self.reply(try_join(state, player, name, self.boards, time.time()))
     
+    @timed
     @update_state
     @log
-    def target(self, game: str, board: int, position: Vector) -> Game:
-        state = self.games.get(game)
-        players = state.players
-        player = players[state.player]
-        opponent = players[board]
-        board = opponent.board
-        x, y = position
-        board[y][x].peg = True
-        
-        if is_sunk(board, position):
-            result = Result.SINK
-            player.sunk.append(board[y][x].ship.type)
-        elif board[y][x].ship:
-            result = Result.HIT
-        else:
-            result = Result.MISS
-
-        return Game(
-            player=next_player(state),
-            players=players,
-            message=message(player, result),
-            finished=has_won(player),
-            updated=time.time()
-        )
+    def target(self, game: str, board: int, position: Vector, state: Game = None) -> tuple[Game, list[Change]]:
+        state = state or self.games.get(game)
+        return self.reply(try_target(state, board, position, time.time()))
@@ -1,18 +1,38 @@
 from abc import ABC, abstractmethod
+from collections import OrderedDict
 from dataclasses import dataclass
+import threading
 import time
-from battleship.model import Message, Result, Ship
-from battleship.server import Game, Player, Status, can_move, has_joined, has_won, is_finished, is_started, get_player
+from battleship.model import BEARINGS, MAX_LENGTH, TILE_CODES, BitBoard, Message, Result, Ship, ShipType, tile_code
+from battleship.server import Game, Player, can_move, has_joined, has_won, is_finished, is_started, get_player
 
 
 class BoardView(ABC):
     def __init__(self, style: dict):
         self.style = style
+        # Untargeted and targeted output of every cell by tile code, so rendering a board is a list lookup per cell
+        self.tiles = [None] * TILE_CODES
+        self.tiles[0] = self.view_cell(None, False), self.view_cell(None, True)
+        for type in ShipType:
+            for bearing in BEARINGS:
+                for offset in range(MAX_LENGTH):
+                    ship = Ship(type=type, bearing=bearing, offset=offset)
+                    self.tiles[tile_code(ship)] = self.view_cell(ship, False), self.view_cell(ship, True)
 
     @abstractmethod
-    def view_cell(self, cell: Status):
+    def view_cell(self, ship: Ship, targeted: bool):
         pass
 
+    def view_rows(self, board: BitBoard) -> list[list[dict]]:
+        # Cells share their dicts with the table, so treat the result as read-only
+        codes, tiles, width = board.tiles(), self.tiles, board.width
+        # One character per cell, lowest first, so reading a peg allocates nothing
+        pegged = format(board.pegs, f'0{width*board.height}b')[::-1]
+        return [
+            [tiles[codes[i]][pegged[i] == '1'] for i in range(y*width, (y+1)*width)]
+            for y in range(board.height)
+        ]
+
     def peg_tile(self, targeted: bool, occupied: bool):
         if targeted and occupied:
             return self.style['PEG_HIT']
@@ -35,10 +55,7 @@ class BoardView(ABC):
     
 
 class PlayerBoard(BoardView):
-    def view_cell(self, cell: Status):
-        targeted = cell.peg
-        ship = cell.ship
-
+    def view_cell(self, ship: Ship, targeted: bool):
         return {
             'background': self.ship_tile(ship) if ship else self.style['EMPTY'],
             'status': self.peg_tile(targeted, ship),
@@ -48,16 +65,13 @@ class PlayerBoard(BoardView):
 
 class OpponentBoard(BoardView):
     def __init__(self, style: dict, active: bool):
-        super().__init__(style)
         self.active = active
+        super().__init__(style)
 
-    def view_cell(self, cell: Status):
-        targeted = cell.peg
-        occupied = cell.ship
-        
+    def view_cell(self, ship: Ship, targeted: bool):
         return {
             'background': self.style['EMPTY'],
-            'status': self.peg_tile(targeted, occupied),
+            'status': self.peg_tile(targeted, ship),
             'target': self.active and not targeted
         }
     
@@ -96,9 +110,16 @@ def prompt(state: Game, viewer: str):
         return f'{get_player(state).name.title()} to move'
     
 
+# Seconds without a move before the players are told the game has stalled
+TIMEOUT = 30
+
+
+def is_stale(updated: float) -> bool:
+    return time.time() - updated > TIMEOUT
+
+
 def timeout(state: Game):
-    age = time.time() - state.updated
-    if age <= 30:
+    if not is_stale(state.updated):
         return None
     if is_started(state):
         return 'state'
@@ -110,11 +131,75 @@ def timeout(state: Game):
 class PlayerView:
     board: list[list[dict]]
     sunk: list[str]
+
+
+class LazyPlayerView:
+    ''' Player view built on first access. key identifies everything the rendered board depends on within a game '''
+    def __init__(self, key: tuple, build):
+        self.key = key
+        self.build = build
+        self.view = None
+
+    def get(self) -> PlayerView:
+        if self.view is None:
+            self.view = self.build()
+        return self.view
+
+    @property
+    def board(self) -> list[list[dict]]:
+        return self.get().board
+
+    @property
+    def sunk(self) -> list[str]:
+        return self.get().sunk
+
+
+class FragmentCache:
+    ''' Bounded LRU of rendered fragments, shared by every request and viewer '''
+    def __init__(self, size: int = 512):
+        self.size = size
+        self.fragments = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple, render):
+        fragment = self.lookup(key)
+        if fragment is None:
+            fragment = self.store(key, render())
+        
+        return fragment
+
+    def lookup(self, key: tuple):
+        ''' Cached fragment for key, or None. Split from get for callers that render asynchronously '''
+        with self.lock:
+            if key in self.fragments:
+                self.hits += 1
+                self.fragments.move_to_end(key)
+                return self.fragments[key]
+            self.misses += 1
+
+    def store(self, key: tuple, fragment):
+        with self.lock:
+            self.fragments[key] = fragment
+            while len(self.fragments) > self.size:
+                self.fragments.popitem(last=False)
+
+        return fragment
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {'size': len(self.fragments), 'hits': self.hits, 'misses': self.misses}
     
 
 class View:
     def __init__(self, style: dict):
         self.style = style
+        self.boards = {
+            'player': PlayerBoard(style),
+            'active': OpponentBoard(style, True),
+            'inactive': OpponentBoard(style, False)
+        }
 
     def render(self, state: Game, viewer: str):
         return {
@@ -127,25 +212,29 @@ class View:
             'can_move': can_move(state, viewer),
             'finished': is_finished(state),
             'message': message(state.message),
+            'reply': message(state.reply),
             'prompt': prompt(state, viewer),
-            'players': [self.view_board(state, player, viewer, i) for i, player in enumerate(state.players)]
+            'players': [
+                LazyPlayerView(
+                    key=(i, self.view_type(state, player, viewer, i), player.board.pegs, len(player.sunk)),
+                    build=lambda player=player, i=i: self.view_board(state, player, viewer, i)
+                )
+                for i, player in enumerate(state.players)
+            ]
         }
 
-    def view_board(self, state: Game, player: Player, viewer: str, i: int):
+    def view_type(self, state: Game, player: Player, viewer: str, i: int) -> str:
         if not has_joined(state, viewer) or is_finished(state) or player.id == viewer:
-            view = PlayerBoard(self.style)
+            return 'player'
+        elif state.player != i and not state.finished:
+            return 'active'
         else:
-            active = state.player != i and not state.finished
-            view = OpponentBoard(self.style, active)
-        
-        board = player.board
+            return 'inactive'
+
+    def view_board(self, state: Game, player: Player, viewer: str, i: int):
+        view = self.boards[self.view_type(state, player, viewer, i)]
         return PlayerView(
             sunk=[self.style['PEG_HIT'] for _ in player.sunk],
-            board=[
-                [
-                    view.view_cell(c)
-                    for c in row
-                ]
-                for row in board
-            ])
-    
\ No newline at end of file
+            board=view.view_rows(player.board)
+        )
+
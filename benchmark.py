@@ -0,0 +1,191 @@
+'''
+Micro-benchmarks for the game engine, serializer, view and a Flask round trip, against an in-memory store.
+Run `python benchmark.py --json benchmark.json` to record timings, and `--baseline benchmark.json` on a later
+revision to compare: it exits with status 1 if any benchmark is slower than the baseline by more than --tolerance.
+'''
+import argparse
+import json
+import logging
+import random
+import statistics
+import sys
+import timeit
+
+from flask import Flask
+from flask.logging import default_handler
+
+from api import configure_routing
+from battleship.model import Game, Player
+from battleship.server import (
+    ConflictException, GameServer, StateUpdater, apply_target, create_board, is_sunk, new_board, setup_board, ships
+)
+from battleship.view import View
+from storage.cache import copy_game
+from storage.serializer import deserialize, serialize
+import tailwind
+
+
+class FrozenUpdater(StateUpdater):
+    ''' In-memory store that always returns the same game and discards updates, so every call does the same work '''
+    def __init__(self, game: Game):
+        self.game = game
+
+    def exists(self, id: str) -> bool:
+        return id == '0'
+
+    def get(self, id: str) -> Game:
+        return copy_game(self.game)
+
+    def insert(self, game: Game) -> str:
+        return '0'
+
+    def update(self, game: Game, id: str, changes=None, expected_version: int = None) -> Game:
+        if expected_version is not None and expected_version != self.game.version:
+            raise ConflictException(f'Game {id} is not at version {expected_version}')
+        return game
+
+    def updated(self, id: str) -> float:
+        return self.game.updated
+
+    def updated_before(self, timestamp: float) -> list[str]:
+        return ['0'] if self.game.updated < timestamp else []
+
+    def delete(self, id: str, expected_version: int = None):
+        pass
+
+
+def mid_game(moves: int = 60, seed: int = 0) -> Game:
+    ''' A started game after moves random targets, player 'a' to move '''
+    rng = random.Random(seed)
+    random.seed(seed)
+    state = Game(player=0, players=[
+        Player(id='a', name='alice', board=create_board(), sunk=[]),
+        Player(id='b', name='bob', board=create_board(), sunk=[])
+    ], updated=0.0, version=2)
+    cells = [(x, y) for x in range(10) for y in range(10)]
+    targets = [rng.sample(cells, len(cells)) for _ in state.players]
+    for i in range(moves + moves % 2):
+        board = 1 - state.player
+        state, _ = apply_target(state, board, targets[board].pop(), float(i))
+
+    return state
+
+
+def free_cell(state: Game, board: int):
+    return next((x, y) for y in range(10) for x in range(10) if not state.players[board].board.is_pegged((x, y)))
+
+
+def round_trip(state: Game):
+    app = Flask(__name__)
+    # Records are still created, as in production, but not written anywhere
+    app.logger.removeHandler(default_handler)
+    app.logger.addHandler(logging.NullHandler())
+    configure_routing(app, FrozenUpdater(state))
+    client = app.test_client()
+    client.set_cookie('player-id', 'a')
+    return client
+
+
+def request(client, method: str, url: str):
+    response = client.open(url, method=method)
+    response.get_data()
+    response.close()
+
+
+def cases() -> dict:
+    ''' Benchmark name to the function timed, each set up once here '''
+    state = mid_game()
+    finished = Game(**{**vars(mid_game()), 'finished': True})
+    doc = serialize(state)
+    fleet = [(k, ships[k]) for k in ships]
+    board = state.players[0].board
+    positions = [(x, y) for y in range(10) for x in range(10)]
+    server = GameServer(FrozenUpdater(state), logging.getLogger('benchmark'))
+    server.logger.addHandler(logging.NullHandler())
+    server.logger.propagate = False
+    position = free_cell(state, 1)
+    view = View(tailwind.config)
+    client = round_trip(state)
+
+    def render(state: Game, viewer: str):
+        # Boards are built lazily, so force them as the templates would
+        return lambda: [player.get() for player in view.render(state, viewer)['players']]
+
+    return {
+        'create_board': create_board,
+        'setup_board': lambda: setup_board(new_board(), fleet),
+        'is_sunk x100': lambda: [is_sunk(board, p) for p in positions],
+        'GameServer.target': lambda: server.target('0', 1, position),
+        'serialize': lambda: serialize(state),
+        'deserialize': lambda: deserialize(doc, Game),
+        'View.render to move': render(state, 'a'),
+        'View.render waiting': render(state, 'b'),
+        'View.render spectator': render(state, 'c'),
+        'View.render finished': render(finished, 'a'),
+        'GET poll': lambda: request(client, 'GET', '/games/0/poll'),
+        'POST target': lambda: request(client, 'POST', f'/games/0/target?board=1&x={position[0]}&y={position[1]}'),
+    }
+
+
+def measure(func, repeat: int = 5, number: int = None) -> dict:
+    ''' Per call timings in us: the fastest of repeat runs is the stable figure, the median shows the noise '''
+    timer = timeit.Timer(func)
+    if number is None:
+        number, _ = timer.autorange()
+
+    times = [total / number * 1e6 for total in timer.repeat(repeat, number)]
+    return {'us': round(min(times), 2), 'median_us': round(statistics.median(times), 2), 'number': number}
+
+
+def run(names: list[str] = None, repeat: int = 5, number: int = None) -> dict:
+    random.seed(0)
+    results = {}
+    for name, func in cases().items():
+        if not names or any(n in name for n in names):
+            results[name] = measure(func, repeat, number)
+
+    return {'python': sys.version.split()[0], 'results': results}
+
+
+def compare(report: dict, baseline: dict, tolerance: float = 0.25) -> list[tuple[str, float]]:
+    ''' (name, ratio to baseline) of every benchmark slower than its baseline by more than tolerance '''
+    regressions = []
+    for name, result in report['results'].items():
+        if name in baseline['results']:
+            ratio = result['us'] / baseline['results'][name]['us']
+            if ratio > 1 + tolerance:
+                regressions.append((name, ratio))
+
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('names', nargs='*', help='Only run benchmarks whose names contain one of these')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', help='Write the results to this file')
+    parser.add_argument('--baseline', help='Compare against results written earlier with --json')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Slowdown allowed before failing, 0.25 for 25%%')
+    args = parser.parse_args()
+
+    report = run(args.names, args.repeat)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+    for name, result in report['results'].items():
+        line = f"{name:24} {result['us']:10.2f} us  (median {result['median_us']:.2f})"
+        if baseline and name in baseline['results']:
+            line += f"  {result['us'] / baseline['results'][name]['us']:6.2f}x baseline"
+        print(line)
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    if baseline:
+        regressions = compare(report, baseline, args.tolerance)
+        for name, ratio in regressions:
+            print(f'Regression: {name} is {ratio:.2f}x its baseline')
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,68 @@
+'''
+Cold start report for an entry point module, importing it in a fresh interpreter with -X importtime.
+Run `python coldstart.py gcp --json coldstart.json` per release and compare the totals and slowest imports.
+'''
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+# Modules the app should not load before its first storage call
+HEAVY = ['firebase_admin', 'google.cloud.firestore', 'grpc']
+
+
+def parse(stderr: str) -> list[tuple[str, int, int]]:
+    ''' (module, depth, cumulative us) for every import in -X importtime output '''
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Nested imports are indented two spaces per level beneath the module that imported them
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((name.strip(), depth, int(cumulative)))
+
+    return imports
+
+
+def measure(module: str, env: dict = None) -> dict:
+    code = f'import sys, {module}; print(*[m for m in {HEAVY!r} if m in sys.modules])'
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        capture_output=True, text=True, check=True, env={**os.environ, **(env or {})}
+    )
+    total = time.perf_counter() - start
+    imports = parse(result.stderr)
+    # Below the top level, so the entry point and interpreter startup do not crowd out its dependencies
+    slowest = sorted([i for i in imports if i[1] > 0], key=lambda i: i[2], reverse=True)[:10]
+    return {
+        'module': module,
+        'python': sys.version.split()[0],
+        'process_ms': round(1000*total, 1),
+        'import_ms': round(sum(cumulative for _, depth, cumulative in imports if depth == 0) / 1000, 1),
+        'heavy': result.stdout.split(),
+        'slowest': [{'module': name, 'cumulative_ms': round(cumulative / 1000, 1)} for name, _, cumulative in slowest]
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('module', nargs='?', default='gcp')
+    parser.add_argument('--json', help='Also write the report to this file')
+    args = parser.parse_args()
+
+    # Measure the import path alone: background initialization would interleave its own imports
+    report = measure(args.module, {'FLASK_FIRESTORE_INIT': 'lazy'})
+    print(f"{report['module']}: {report['process_ms']} ms to start and import, {report['import_ms']} ms of imports")
+    print(f"Heavy modules loaded: {', '.join(report['heavy']) or 'none'}")
+    for entry in report['slowest']:
+        print(f"  {entry['cumulative_ms']:8.1f} ms  {entry['module']}")
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=2)
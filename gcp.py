@@ -1,13 +1,69 @@
+import time
+started = time.perf_counter()
+
 import logging
+from threading import Thread
 from api import configure_routing
+from battleship.hub import GameHub
+from battleship.metrics import Metrics
+from battleship.pool import BoardPool
+from battleship.server import create_board
 from flask import Flask
 
-from storage.firestore import FirestoreUpdater
+from storage.archive import Archive
+from storage.cache import CachingUpdater
+from storage.lazy import LazyUpdater
+from storage.metered import MeteredUpdater
+from storage.retention import RetentionPolicy, Sweeper
+imported = time.perf_counter()
+
+
+def create_firestore():
+    # Imported here so the Firestore client and gRPC load off the import path of the app
+    from storage.firestore import FirestoreUpdater
+    return FirestoreUpdater()
 
 
 gunicorn_logger = logging.getLogger('gunicorn.error')
 app = Flask(__name__)
 app.logger.handlers = gunicorn_logger.handlers
 app.logger.setLevel(gunicorn_logger.level)
+app.config.from_prefixed_env()
+
+pool = BoardPool(create_board, app.logger)
+Thread(target=pool.run, daemon=True).start()
+
+# FLASK_FIRESTORE_INIT: 'background' builds the client on a thread while the app starts serving,
+# 'lazy' on the first request that needs it and 'eager' before the app is importable
+init = app.config.get('FIRESTORE_INIT', 'background')
+warm_up = (lambda updater: updater.warm_up()) if app.config.get('FIRESTORE_WARM_UP', True) else None
+updater = LazyUpdater(create_firestore, app.logger, warm_up)
+if init == 'eager':
+    updater.run()
+elif init == 'background':
+    Thread(target=updater.run, daemon=True).start()
+
+metrics = Metrics()
+backend = MeteredUpdater(updater, metrics, 'firestore')
+games = CachingUpdater(backend)
+metrics.watch('games', games)
+# Finished games are only archived, then removed, if FLASK_ARCHIVE names a persistent file
+archive = app.config.get('ARCHIVE')
+interval = app.config.get('RETENTION_INTERVAL', 3600.0)
+sweeper = Sweeper(
+    backend,
+    app.logger,
+    Archive(archive) if archive else None,
+    RetentionPolicy(**app.config.get('RETENTION', {})),
+    interval=interval,
+    cache=games,
+    # Every instance starts a sweeper: the one holding the lease sweeps, and others take over if it stops renewing
+    lease=lambda: updater.backend().lease('sweeper', 2 * interval)
+)
+Thread(target=sweeper.run, daemon=True).start()
 
-configure_routing(app, FirestoreUpdater())
+configure_routing(app, games, pool, GameHub(), metrics=metrics)
+app.logger.info(
+    'App ready in %.0f ms (imports %.0f ms), Firestore initialization %s',
+    1000*(time.perf_counter() - started), 1000*(imported - started), init
+)
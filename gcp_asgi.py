@@ -0,0 +1,21 @@
+import logging
+from threading import Thread
+from async_api import configure_routing
+from battleship.async_server import AsyncGameHub
+from battleship.metrics import Metrics
+from battleship.pool import BoardPool
+from battleship.server import create_board
+from quart import Quart
+
+from storage.firestore import AsyncFirestoreUpdater
+
+
+hypercorn_logger = logging.getLogger('hypercorn.error')
+app = Quart(__name__)
+app.logger.handlers = hypercorn_logger.handlers
+app.logger.setLevel(hypercorn_logger.level)
+
+pool = BoardPool(create_board, app.logger)
+Thread(target=pool.run, daemon=True).start()
+
+configure_routing(app, AsyncFirestoreUpdater(), pool, AsyncGameHub(), metrics=Metrics())
@@ -0,0 +1,35 @@
+import gzip
+import json
+import threading
+from typing import Iterator
+
+from battleship.model import Game
+from storage.serializer import deserialize, serialize
+
+
+def encode(id: str, game: Game) -> bytes:
+    return json.dumps({'id': id, 'game': serialize(game)}, separators=(',', ':')).encode() + b'\n'
+
+
+class Archive:
+    '''
+    Cold storage for games removed from the live store: gzipped JSON lines of {"id", "game"} records.
+    Each batch is appended as its own gzip member, so writing never rewrites earlier batches.
+    '''
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def extend(self, games: dict[str, Game]):
+        if not games:
+            return
+
+        data = b''.join(encode(id, game) for id, game in games.items())
+        with self.lock, gzip.open(self.path, 'ab') as file:
+            file.write(data)
+
+    def read(self) -> Iterator[tuple[str, Game]]:
+        with gzip.open(self.path, 'rb') as file:
+            for line in file:
+                record = json.loads(line)
+                yield record['id'], deserialize(record['game'], Game)
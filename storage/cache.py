@@ -0,0 +1,113 @@
+from collections import OrderedDict
+import threading
+import time
+
+from battleship.model import Game, Player
+from battleship.server import Change, StateUpdater
+
+
+def copy_game(game: Game) -> Game:
+    # GameServer mutates boards and sunk lists in place, so callers must never share a cached game
+    return Game(**{
+        **vars(game),
+        'players': [Player(**{**vars(p), 'board': p.board.copy(), 'sunk': list(p.sunk)}) for p in game.players]
+    })
+
+
+class CachingUpdater(StateUpdater):
+    '''
+    Read-through cache of deserialized games in front of another StateUpdater.
+    Entries older than ttl seconds are revalidated against the backend's updated timestamp,
+    and the least recently used entries are evicted beyond size.
+    '''
+    def __init__(self, backend: StateUpdater, size: int = 1024, ttl: float = 1.0):
+        self.backend = backend
+        self.size = size
+        self.ttl = ttl
+        self.games = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'size': len(self.games),
+                'hits': self.hits,
+                'revalidations': self.revalidations,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+    def store(self, id: str, game: Game):
+        with self.lock:
+            self.games[id] = copy_game(game), time.monotonic()
+            self.games.move_to_end(id)
+            while len(self.games) > self.size:
+                self.games.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, id: str):
+        with self.lock:
+            self.games.pop(id, None)
+
+    def exists(self, id: str) -> bool:
+        with self.lock:
+            if id in self.games:
+                return True
+        
+        return self.backend.exists(id)
+
+    def fetch(self, id: str) -> Game:
+        # Returns the shared cached copy: callers must not let it escape unless copied
+        with self.lock:
+            game, fetched = self.games.get(id, (None, None))
+            if game is not None and time.monotonic() - fetched <= self.ttl:
+                self.hits += 1
+                self.games.move_to_end(id)
+                return game
+
+        if game is not None and self.backend.updated(id) == game.updated:
+            with self.lock:
+                self.revalidations += 1
+                self.games[id] = game, time.monotonic()
+            return game
+
+        with self.lock:
+            self.misses += 1
+        game = self.backend.get(id)
+        self.store(id, game)
+        return game
+
+    def get(self, id: str) -> Game:
+        return copy_game(self.fetch(id))
+
+    def insert(self, game: Game) -> str:
+        id = self.backend.insert(game)
+        self.store(id, game)
+        return id
+
+    def update(self, game: Game, id: str, changes: list[Change] = None, expected_version: int = None) -> Game:
+        try:
+            game = self.backend.update(game, id, changes, expected_version)
+        except Exception:
+            # Including conflicts: the cached copy is behind the store, so the retry must read through
+            self.invalidate(id)
+            raise
+        
+        self.store(id, game)
+        return game
+
+    def updated(self, id: str) -> float:
+        return self.fetch(id).updated
+
+    def updated_before(self, timestamp: float) -> list[str]:
+        return self.backend.updated_before(timestamp)
+
+    def delete(self, id: str, expected_version: int = None):
+        try:
+            self.backend.delete(id, expected_version)
+        finally:
+            self.invalidate(id)
@@ -0,0 +1,190 @@
+import threading
+import time
+from typing import Iterator
+
+from battleship.model import Game, Player, Vector
+from battleship.server import Change, ConflictException, StateUpdater, add_player, apply_reply, apply_target
+from storage.cache import copy_game
+from storage.log import AppendOnlyLog
+from storage.serializer import deserialize, serialize
+
+
+def record(id: str, event: dict) -> dict:
+    return {'id': id, 'event': event}
+
+
+def snapshot(game: Game) -> dict:
+    doc = serialize(game)
+    return {'kind': 'snapshot', 'game': doc, 'updated': doc['updated']}
+
+
+def apply(state: Game, event: dict) -> Game:
+    ''' State after event. Moves update the pegs and sunk lists of state in place '''
+    kind = event['kind']
+    if kind == 'snapshot':
+        return deserialize(event['game'], Game)
+    elif kind == 'join':
+        game, _ = add_player(state, deserialize(event['player'], Player), event['updated'])
+        return game
+    elif kind == 'move':
+        game, _ = apply_target(state, event['board'], (event['x'], event['y']), event['updated'])
+        return game
+    elif kind == 'reply':
+        game, _ = apply_reply(state, (event['x'], event['y']), state.version)
+        return game
+
+    raise ValueError(f'Unknown event {kind}')
+
+
+def fired(before: int, after: int, width: int) -> Vector:
+    ''' Position of the one peg added between before and after, or None '''
+    shot = after & ~before
+    if after & before != before or not shot or shot & (shot - 1):
+        return None
+
+    y, x = divmod(shot.bit_length() - 1, width)
+    return x, y
+
+
+def derive(old: Game, new: Game, changes: list[Change]) -> list[dict]:
+    ''' The join or move taking old to new, then the computer's reply if it made one, or None if the update is anything else '''
+    if not changes or old is None or len(new.players) not in (len(old.players), len(old.players) + 1):
+        return None
+
+    pegs = [player.board.pegs for player in new.players]
+    events = []
+    if new.reply is not None and ('reply',) in changes:
+        # The computer fires at the board of the player it hands the turn back to, a new seat's included
+        board = new.player
+        before = old.players[board].board.pegs if board < len(old.players) else 0
+        if (position := fired(before, pegs[board], new.players[board].board.width)) is None:
+            return None
+        pegs[board] = before
+        events.append({'kind': 'reply', 'x': position[0], 'y': position[1], 'updated': new.updated})
+
+    if len(new.players) > len(old.players):
+        player = Player(**{**vars(new.players[-1]), 'board': new.players[-1].board.copy()})
+        player.board.pegs = pegs[-1]
+        events.insert(0, {'kind': 'join', 'player': serialize(player), 'updated': new.updated})
+    else:
+        shots = [(board, fired(player.board.pegs, pegs[board], player.board.width))
+                 for board, player in enumerate(old.players) if player.board.pegs != pegs[board]]
+        if len(shots) != 1 or shots[0][1] is None:
+            return None
+        [(board, (x, y))] = shots
+        events.insert(0, {'kind': 'move', 'player': old.player, 'board': board, 'x': x, 'y': y, 'updated': new.updated})
+
+    state = old
+    for event in events:
+        state = apply(state, event)
+    # Only log the events if replaying them reproduces the update exactly
+    return events if state == new else None
+
+
+class EventUpdater(AppendOnlyLog, StateUpdater):
+    '''
+    Append-only log of game events: a snapshot when a game is created, then one small record per join or move,
+    and per reply from the computer. Games are rebuilt by replaying events onto their latest snapshot, and a snapshot
+    is appended every snapshot_every events to keep replays short. Other updates are logged as snapshots.
+    Compaction drops every event before each game's latest snapshot, and the events of deleted games.
+    '''
+    def __init__(self, logger, path: str, sync: bool = True, snapshot_every: int = 32, ratio: float = 4.0,
+                 interval: float = 60.0):
+        self.snapshot_every = snapshot_every
+        # Each game's lock, held from reading it to appending its update
+        self.locks = {}
+        super().__init__(logger, path, sync, ratio, interval)
+
+    def reset(self):
+        # Per game: the location of every record, the position of the latest snapshot among them and the last timestamp
+        self.records, self.snapshots, self.latest = {}, {}, {}
+
+    def track(self, record: dict, offset: int, length: int):
+        id, event = record['id'], record['event']
+        if event['kind'] == 'delete':
+            # The game's history stays in the log, but is no longer reachable
+            for games in self.records, self.snapshots, self.latest:
+                games.pop(id, None)
+            return
+
+        records = self.records.setdefault(id, [])
+        if event['kind'] == 'snapshot':
+            self.snapshots[id] = len(records)
+
+        records.append((offset, length))
+        self.latest[id] = event['updated']
+
+    def live(self) -> dict[str, list[tuple[int, int]]]:
+        return {id: records[self.snapshots[id]:] for id, records in self.records.items()}
+
+    def tombstone(self, id: str) -> dict:
+        return record(id, {'kind': 'delete', 'updated': time.time()})
+
+    def game_lock(self, id: str) -> threading.Lock:
+        with self.lock:
+            return self.locks.setdefault(id, threading.Lock())
+
+    def events(self, id: str, start: int = 0) -> list[dict]:
+        with self.lock:
+            return [self.read(offset, length)['event'] for offset, length in self.records[id][start:]]
+
+    def replay(self, id: str) -> Iterator[Game]:
+        ''' Every stored state of a game, oldest first, for debugging and analysis '''
+        state = None
+        for event in self.events(id):
+            state = apply(state, event)
+            yield copy_game(state)
+
+    def exists(self, id: str) -> bool:
+        return id in self.records
+
+    def get(self, id: str) -> Game:
+        state = None
+        for event in self.events(id, self.snapshots[id]):
+            state = apply(state, event)
+
+        return state
+
+    def updated(self, id: str) -> float:
+        return self.latest[id]
+
+    def insert(self, game: Game) -> str:
+        id = self.new_id()
+        self.append(record(id, snapshot(game)))
+        return id
+
+    def update(self, game: Game, id: str, changes: list[Change] = None, expected_version: int = None) -> Game:
+        with self.game_lock(id):
+            # Held from reading the current state to appending, so every event follows the state it was derived from
+            if expected_version is not None and id not in self.records:
+                raise ConflictException(f'Game {id} is not at version {expected_version}')
+            state = self.get(id)
+            if expected_version is not None and state.version != expected_version:
+                raise ConflictException(f'Game {id} is not at version {expected_version}')
+            
+            # A move and the computer's reply are written together
+            self.append(*(record(id, event) for event in derive(state, game, changes) or [snapshot(game)]))
+            if len(self.records[id]) - self.snapshots[id] > self.snapshot_every:
+                self.append(record(id, snapshot(game)))
+
+        return game
+
+    def updated_before(self, timestamp: float) -> list[str]:
+        with self.lock:
+            return [id for id, updated in self.latest.items() if updated < timestamp]
+
+    def delete(self, id: str, expected_version: int = None):
+        with self.game_lock(id):
+            if id not in self.records:
+                if expected_version is not None:
+                    raise ConflictException(f'Game {id} is not at version {expected_version}')
+                return
+
+            if expected_version is not None and self.get(id).version != expected_version:
+                raise ConflictException(f'Game {id} is not at version {expected_version}')
+
+            # Its events are left out of the next compaction
+            self.append(self.tombstone(id))
+
+        with self.lock:
+            self.locks.pop(id, None)
@@ -0,0 +1,34 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from battleship.async_server import AsyncStateUpdater
+from battleship.model import Game
+from battleship.server import Change, StateUpdater
+
+
+class ExecutorUpdater(AsyncStateUpdater):
+    '''
+    Runs a blocking StateUpdater on a small thread pool, so local stores never block the event loop.
+    Waiting clients hold no thread: only storage calls in flight do.
+    '''
+    def __init__(self, backend: StateUpdater, workers: int = 8):
+        self.backend = backend
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix='storage')
+
+    async def call(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def exists(self, id: str) -> bool:
+        return await self.call(self.backend.exists, id)
+
+    async def get(self, id: str) -> Game:
+        return await self.call(self.backend.get, id)
+
+    async def updated(self, id: str) -> float:
+        return await self.call(self.backend.updated, id)
+
+    async def insert(self, game: Game) -> str:
+        return await self.call(self.backend.insert, game)
+
+    async def update(self, game: Game, id: str, changes: list[Change] = None, expected_version: int = None) -> Game:
+        return await self.call(self.backend.update, game, id, changes, expected_version)
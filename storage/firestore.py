@@ -1,16 +1,53 @@
+import time
+import uuid
+
+from battleship.async_server import AsyncStateUpdater
 from battleship.model import Game
-from battleship.server import StateUpdater
+from battleship.server import Change, ConflictException, StateUpdater
 import firebase_admin
-from firebase_admin import firestore
+from firebase_admin import firestore, firestore_async
+
+from storage.serializer import deserialize, is_legacy, serialize, upgrade
+
+
+def to_document(doc: dict) -> dict:
+    # Firestore cannot address array elements by field path, so players are stored as a map keyed by index
+    return {**doc, 'players': {str(i): p for i, p in enumerate(doc['players'])}}
+
+
+def from_document(doc: dict) -> dict:
+    players = doc['players']
+    if isinstance(players, dict):
+        players = [players[k] for k in sorted(players, key=int)]
+
+    return {**doc, 'players': players}
+
 
-from storage.serializer import deserialize, serialize
+def lookup(doc: dict, path: Change):
+    for key in path:
+        doc = doc[str(key)]
+
+    return doc
+
+
+def fields(doc: dict, changes: list[Change]) -> dict:
+    return {firestore.FieldPath(*map(str, path)).to_api_repr(): lookup(doc, path) for path in changes}
+
+
+def initialize():
+    # The sync and async updaters share the default app
+    try:
+        firebase_admin.get_app()
+    except ValueError:
+        firebase_admin.initialize_app()
 
 
 class FirestoreUpdater(StateUpdater):
     def __init__(self):
-        _ = firebase_admin.initialize_app()
+        initialize()
         self.db = firestore.client()
         self.collection = 'battleship'
+        self.holder = str(uuid.uuid4())
 
     def exists(self, id: str) -> bool:
         ref = self.db.collection(self.collection).document(id)
@@ -19,15 +56,191 @@ class FirestoreUpdater(StateUpdater):
 
     def get(self, id: str) -> Game:
         ref = self.db.collection(self.collection).document(id)
-        doc = ref.get()
-        return deserialize(doc.to_dict(), Game)
+        data = ref.get().to_dict()
+        if data is None:
+            raise KeyError(f'Game {id} not found')
+
+        if isinstance(data['players'], list):
+            # Convert in place so later field path updates find the map layout
+            data = self.convert(ref)
+        
+        return deserialize(from_document(data), Game)
+
+    def convert(self, ref) -> dict:
+        ''' Rewrite a document still holding a players array as a map, returning its data '''
+        @firestore.transactional
+        def rewrite(transaction):
+            # Converted as read within the transaction, which Firestore reruns if a move commits meanwhile
+            data = ref.get(transaction=transaction).to_dict()
+            if data is None:
+                raise KeyError(f'Game {ref.id} not found')
+            if isinstance(data['players'], list):
+                data = upgrade(data)
+                transaction.set(ref, to_document(data))
+
+            return data
+
+        return rewrite(self.db.transaction())
+
+    def updated(self, id: str) -> float:
+        ref = self.db.collection(self.collection).document(id)
+        return ref.get(field_paths=['updated']).get('updated')
 
     def insert(self, game: Game) -> str:
         ref = self.db.collection(self.collection).document()
-        ref.set(serialize(game))
+        ref.set(to_document(serialize(game)))
+        return ref.id
+
+    def update(self, game: Game, id: str, changes: list[Change] = None, expected_version: int = None) -> Game:
+        ref = self.db.collection(self.collection).document(id)
+        doc = to_document(serialize(game))
+        if expected_version is None:
+            if changes is None:
+                ref.set(doc)
+            else:
+                ref.update(fields(doc, changes))
+            
+            return game
+
+        @firestore.transactional
+        def compare_and_set(transaction):
+            # Firestore reruns the transaction if the game is written concurrently, so the check holds at commit
+            stored = ref.get(field_paths=['version'], transaction=transaction).to_dict() or {}
+            if stored.get('version', 0) != expected_version:
+                raise ConflictException(f'Game {id} is not at version {expected_version}')
+            
+            if changes is None:
+                transaction.set(ref, doc)
+            else:
+                transaction.update(ref, fields(doc, changes))
+
+        compare_and_set(self.db.transaction())
+        return game
+
+    def updated_before(self, timestamp: float) -> list[str]:
+        # Listed up front, as a stream left open through a rate-limited sweep would time out
+        query = self.db.collection(self.collection).where(filter=firestore.FieldFilter('updated', '<', timestamp))
+        return [doc.id for doc in query.select(['updated']).stream()]
+
+    def delete(self, id: str, expected_version: int = None):
+        ref = self.db.collection(self.collection).document(id)
+        if expected_version is None:
+            ref.delete()
+            return
+
+        @firestore.transactional
+        def compare_and_delete(transaction):
+            stored = ref.get(field_paths=['version'], transaction=transaction).to_dict() or {}
+            if stored.get('version', 0) != expected_version:
+                raise ConflictException(f'Game {id} is not at version {expected_version}')
+            
+            transaction.delete(ref)
+
+        compare_and_delete(self.db.transaction())
+
+    def lease(self, name: str, ttl: float) -> bool:
+        ''' Take or renew lease name for ttl seconds, unless another instance holds it and has renewed it within ttl '''
+        ref = self.db.collection('leases').document(name)
+
+        @firestore.transactional
+        def take(transaction):
+            lease = ref.get(transaction=transaction).to_dict() or {}
+            now = time.time()
+            if lease.get('holder', self.holder) != self.holder and lease.get('expires', 0) > now:
+                return False
+
+            transaction.set(ref, {'holder': self.holder, 'expires': now + ttl})
+            return True
+
+        return take(self.db.transaction())
+
+    def warm_up(self):
+        ''' Open the gRPC channel and fetch credentials with a one-field read, so the first request does not pay for them '''
+        self.db.collection(self.collection).document('warm-up').get(field_paths=['updated'])
+
+    def migrate(self) -> int:
+        ''' Upgrade documents still holding legacy boards or a players array, returning how many were rewritten '''
+        count = 0
+        for doc in self.db.collection(self.collection).stream():
+            data = doc.to_dict()
+            if is_legacy(from_document(data)) or isinstance(data['players'], list):
+                try:
+                    # Only if no move landed since the document was listed: the next run picks it up otherwise
+                    self.update(deserialize(from_document(data), Game), doc.id, None, data.get('version', 0))
+                    count += 1
+                except ConflictException:
+                    pass
+
+        return count
+
+
+class AsyncFirestoreUpdater(AsyncStateUpdater):
+    ''' FirestoreUpdater on the AsyncClient, for the async serving path. Documents are laid out identically '''
+    def __init__(self):
+        initialize()
+        self.db = firestore_async.client()
+        self.collection = 'battleship'
+
+    async def exists(self, id: str) -> bool:
+        ref = self.db.collection(self.collection).document(id)
+        doc = await ref.get()
+        return doc.exists
+
+    async def get(self, id: str) -> Game:
+        ref = self.db.collection(self.collection).document(id)
+        data = (await ref.get()).to_dict()
+        if data is None:
+            raise KeyError(f'Game {id} not found')
+
+        if isinstance(data['players'], list):
+            data = await self.convert(ref)
+
+        return deserialize(from_document(data), Game)
+
+    async def convert(self, ref) -> dict:
+        @firestore.async_transactional
+        async def rewrite(transaction):
+            data = (await ref.get(transaction=transaction)).to_dict()
+            if data is None:
+                raise KeyError(f'Game {ref.id} not found')
+            if isinstance(data['players'], list):
+                data = upgrade(data)
+                transaction.set(ref, to_document(data))
+
+            return data
+
+        return await rewrite(self.db.transaction())
+
+    async def updated(self, id: str) -> float:
+        ref = self.db.collection(self.collection).document(id)
+        return (await ref.get(field_paths=['updated'])).get('updated')
+
+    async def insert(self, game: Game) -> str:
+        ref = self.db.collection(self.collection).document()
+        await ref.set(to_document(serialize(game)))
         return ref.id
 
-    def update(self, game: Game, id: str) -> Game:
+    async def update(self, game: Game, id: str, changes: list[Change] = None, expected_version: int = None) -> Game:
         ref = self.db.collection(self.collection).document(id)
-        ref.set(serialize(game))
+        doc = to_document(serialize(game))
+        if expected_version is None:
+            if changes is None:
+                await ref.set(doc)
+            else:
+                await ref.update(fields(doc, changes))
+
+            return game
+
+        @firestore.async_transactional
+        async def compare_and_set(transaction):
+            stored = (await ref.get(field_paths=['version'], transaction=transaction)).to_dict() or {}
+            if stored.get('version', 0) != expected_version:
+                raise ConflictException(f'Game {id} is not at version {expected_version}')
+
+            if changes is None:
+                transaction.set(ref, doc)
+            else:
+                transaction.update(ref, fields(doc, changes))
+
+        await compare_and_set(self.db.transaction())
         return game
@@ -0,0 +1,73 @@
+from battleship.model import Game
+from battleship.server import Change, ConflictException, StateUpdater
+from storage.log import AppendOnlyLog
+from storage.serializer import deserialize, serialize
+
+
+class JournalUpdater(AppendOnlyLog, StateUpdater):
+    '''
+    Append-only log of serialized games with an in-memory index of each game's latest record.
+    A null game is a tombstone, recording that the game was deleted.
+    '''
+    def reset(self):
+        # Per game: offset and length of its latest record, its timestamp and version
+        self.index = {}
+
+    def track(self, record: dict, offset: int, length: int):
+        id, game = record['id'], record['game']
+        if game is None:
+            self.index.pop(id, None)
+        else:
+            self.index[id] = offset, length, game['updated'], game.get('version', 0)
+
+    def live(self) -> dict[str, list[tuple[int, int]]]:
+        return {id: [(offset, length)] for id, (offset, length, *_) in self.index.items()}
+
+    def tombstone(self, id: str) -> dict:
+        return {'id': id, 'game': None}
+
+    def check(self, id: str, expected_version: int = None):
+        ''' Raise ConflictException unless game id is at expected_version, if given. Call with the lock held '''
+        if expected_version is not None and (id not in self.index or self.index[id][3] != expected_version):
+            # Including a game deleted since it was read
+            raise ConflictException(f'Game {id} is not at version {expected_version}')
+
+    def exists(self, id: str) -> bool:
+        return id in self.index
+
+    def get(self, id: str) -> Game:
+        with self.lock:
+            offset, length, *_ = self.index[id]
+            doc = self.read(offset, length)['game']
+
+        return deserialize(doc, Game)
+
+    def updated(self, id: str) -> float:
+        _, _, updated, _ = self.index[id]
+        return updated
+
+    def insert(self, game: Game) -> str:
+        id = self.new_id()
+        self.append({'id': id, 'game': serialize(game)})
+        return id
+
+    def update(self, game: Game, id: str, changes: list[Change] = None, expected_version: int = None) -> Game:
+        record = {'id': id, 'game': serialize(game)}
+        with self.lock:
+            self.check(id, expected_version)
+            self.write(record)
+
+        return game
+
+    def updated_before(self, timestamp: float) -> list[str]:
+        with self.lock:
+            return [id for id, (_, _, updated, _) in self.index.items() if updated < timestamp]
+
+    def delete(self, id: str, expected_version: int = None):
+        with self.lock:
+            if expected_version is None and id not in self.index:
+                # Already deleted, so there is nothing to record
+                return
+
+            self.check(id, expected_version)
+            self.write(self.tombstone(id))
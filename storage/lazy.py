@@ -0,0 +1,64 @@
+import threading
+import time
+
+from battleship.model import Game
+from battleship.server import Change, StateUpdater
+
+
+class LazyUpdater(StateUpdater):
+    '''
+    StateUpdater whose backend is built by factory on first use, so requests that never touch storage are served
+    without waiting for it. Call run() on a background thread to build it ahead of the first request instead.
+    warm_up, if given, is called with the new backend before any request uses it.
+    '''
+    def __init__(self, factory, logger, warm_up=None):
+        self.factory = factory
+        self.logger = logger
+        self.warm_up = warm_up
+        self.lock = threading.Lock()
+        self.instance = None
+
+    def backend(self) -> StateUpdater:
+        if self.instance is None:
+            with self.lock:
+                # Requests arriving mid-initialization wait for it rather than starting their own
+                if self.instance is None:
+                    start = time.perf_counter()
+                    backend = self.factory()
+                    self.logger.info('Storage initialized in %.0f ms', 1000*(time.perf_counter() - start))
+                    if self.warm_up:
+                        start = time.perf_counter()
+                        self.warm_up(backend)
+                        self.logger.info('Storage warmed up in %.0f ms', 1000*(time.perf_counter() - start))
+
+                    self.instance = backend
+
+        return self.instance
+
+    def run(self):
+        try:
+            self.backend()
+        except Exception:
+            # Not fatal: the first request will try again
+            self.logger.exception('Background storage initialization failed')
+
+    def exists(self, id: str) -> bool:
+        return self.backend().exists(id)
+
+    def get(self, id: str) -> Game:
+        return self.backend().get(id)
+
+    def updated(self, id: str) -> float:
+        return self.backend().updated(id)
+
+    def insert(self, game: Game) -> str:
+        return self.backend().insert(game)
+
+    def update(self, game: Game, id: str, changes: list[Change] = None, expected_version: int = None) -> Game:
+        return self.backend().update(game, id, changes, expected_version)
+
+    def updated_before(self, timestamp: float) -> list[str]:
+        return self.backend().updated_before(timestamp)
+
+    def delete(self, id: str, expected_version: int = None):
+        self.backend().delete(id, expected_version)
@@ -0,0 +1,141 @@
+from abc import ABC, abstractmethod
+import json
+import os
+import threading
+
+
+def encode(record: dict) -> bytes:
+    return json.dumps(record, separators=(',', ':')).encode() + b'\n'
+
+
+class AppendOnlyLog(ABC):
+    '''
+    File of JSON records, one per line and each naming a game id, indexed in memory by subclasses as they are
+    loaded and appended. Call run() on a background thread to compact the log once records no longer live dominate it.
+    '''
+    def __init__(self, logger, path: str, sync: bool = True, ratio: float = 4.0, interval: float = 60.0):
+        self.logger = logger
+        self.path = path
+        self.sync = sync
+        self.ratio = ratio
+        self.interval = interval
+        # Guards the files and the index
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.load()
+
+    @abstractmethod
+    def reset(self):
+        ''' Clear the index before the log is loaded '''
+        pass
+
+    @abstractmethod
+    def track(self, record: dict, offset: int, length: int):
+        ''' Index record, found at offset. Called with the lock held, or while loading '''
+        pass
+
+    @abstractmethod
+    def live(self) -> dict[str, list[tuple[int, int]]]:
+        ''' Offset and length of the records still needed, per game id, in log order. Called with the lock held '''
+        pass
+
+    @abstractmethod
+    def tombstone(self, id: str) -> dict:
+        ''' Record of game id having been deleted '''
+        pass
+
+    def load(self):
+        self.reset()
+        self.next_id = 1
+        self.reader = open(self.path, 'a+b')
+        self.reader.seek(0)
+        end = 0
+        for line in self.reader:
+            if not line.endswith(b'\n'):
+                # Torn write from a crash: everything from here is discarded
+                break
+
+            record = json.loads(line)
+            # Ids of deleted games are never reused
+            self.next_id = max(self.next_id, int(record['id']) + 1)
+            self.track(record, end, len(line))
+            end += len(line)
+
+        self.reader.truncate(end)
+        self.writer = open(self.path, 'ab')
+        self.size = end
+        self.logger.info('Recovered %s games from %s', len(self.live()), self.path)
+
+    def new_id(self) -> str:
+        with self.lock:
+            id = str(self.next_id)
+            self.next_id += 1
+
+        return id
+
+    def write(self, *records: dict):
+        ''' Append records in one write, then index them. Call with the lock held '''
+        lines = [encode(record) for record in records]
+        self.writer.write(b''.join(lines))
+        self.writer.flush()
+        if self.sync:
+            os.fsync(self.writer.fileno())
+
+        for record, line in zip(records, lines):
+            self.track(record, self.size, len(line))
+            self.size += len(line)
+
+    def append(self, *records: dict):
+        with self.lock:
+            self.write(*records)
+
+    def read(self, offset: int, length: int) -> dict:
+        ''' The record at offset. Call with the lock held '''
+        self.reader.seek(offset)
+        return json.loads(self.reader.read(length))
+
+    def live_size(self) -> int:
+        with self.lock:
+            return sum(length for records in self.live().values() for _, length in records)
+
+    def compact(self):
+        ''' Rewrite the log with only the live records, without blocking writers while copying '''
+        with self.lock:
+            live = self.live()
+            end = self.size
+            last = self.next_id - 1
+
+        temp = f'{self.path}.compact'
+        with open(self.path, 'rb') as source, open(temp, 'wb') as target:
+            for records in live.values():
+                for offset, length in records:
+                    source.seek(offset)
+                    target.write(source.read(length))
+
+            if last and str(last) not in live:
+                # Keep the highest id issued, so it is not reused once the game's records are gone
+                target.write(encode(self.tombstone(str(last))))
+
+            with self.lock:
+                # Carry over anything appended while copying, then swap files before releasing writers
+                source.seek(end)
+                target.write(source.read(self.size - end))
+                target.flush()
+                os.fsync(target.fileno())
+
+                self.reader.close()
+                self.writer.close()
+                os.replace(temp, self.path)
+                before = self.size
+                self.load()
+
+        self.logger.info('Compacted %s from %s to %s bytes', self.path, before, self.size)
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        self.logger.info('Compacting %s every %s s when over %sx live size...', self.path, self.interval, self.ratio)
+        while not self.stopped.wait(self.interval):
+            if self.size > self.ratio * max(self.live_size(), 1):
+                self.compact()
@@ -0,0 +1,57 @@
+from functools import wraps
+import time
+
+from battleship.metrics import Metrics
+from battleship.model import Game
+from battleship.server import Change, StateUpdater
+
+
+def metered(func):
+    @wraps(func)
+    def inner(self: 'MeteredUpdater', *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(self, *args, **kwargs)
+        except Exception as e:
+            self.metrics.errors.inc(self.name, func.__name__, type(e).__name__)
+            raise
+        finally:
+            self.metrics.storage.observe(time.perf_counter() - start, self.name, func.__name__)
+
+    return inner
+
+
+class MeteredUpdater(StateUpdater):
+    ''' Records the latency and failures of every call to backend, labelled with name, e.g. its storage engine '''
+    def __init__(self, backend: StateUpdater, metrics: Metrics, name: str = None):
+        self.backend = backend
+        self.metrics = metrics
+        self.name = name or type(backend).__name__.removesuffix('Updater').lower()
+
+    @metered
+    def exists(self, id: str) -> bool:
+        return self.backend.exists(id)
+
+    @metered
+    def get(self, id: str) -> Game:
+        return self.backend.get(id)
+
+    @metered
+    def updated(self, id: str) -> float:
+        return self.backend.updated(id)
+
+    @metered
+    def insert(self, game: Game) -> str:
+        return self.backend.insert(game)
+
+    @metered
+    def update(self, game: Game, id: str, changes: list[Change] = None, expected_version: int = None) -> Game:
+        return self.backend.update(game, id, changes, expected_version)
+
+    @metered
+    def updated_before(self, timestamp: float) -> list[str]:
+        return self.backend.updated_before(timestamp)
+
+    @metered
+    def delete(self, id: str, expected_version: int = None):
+        self.backend.delete(id, expected_version)
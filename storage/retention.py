@@ -0,0 +1,151 @@
+from collections import Counter
+from dataclasses import dataclass
+import fcntl
+import math
+import threading
+import time
+
+from battleship.model import Game
+from battleship.server import ConflictException, StateUpdater, is_started
+from storage.archive import Archive
+
+
+@dataclass
+class RetentionPolicy:
+    ''' Seconds since a game's last move before the sweeper removes it '''
+    unjoined: float = 24 * 3600
+    finished: float = 3600
+    abandoned: float = 7 * 24 * 3600
+
+
+def classify(game: Game, now: float, policy: RetentionPolicy) -> str:
+    ''' What the sweeper does with game: expire, archive, purge, or None to keep it '''
+    age = now - game.updated
+    if game.finished:
+        return 'archive' if age > policy.finished else None
+    elif not is_started(game):
+        return 'expire' if age > policy.unjoined else None
+    else:
+        return 'purge' if age > policy.abandoned else None
+
+
+def deadline(game: Game, policy: RetentionPolicy) -> float:
+    ''' Time after which classify acts on game, unless it moves first '''
+    if game.finished:
+        return game.updated + policy.finished
+    elif not is_started(game):
+        return game.updated + policy.unjoined
+    else:
+        return game.updated + policy.abandoned
+
+
+class FileLease:
+    '''
+    Sweeper lease held by the first process on this host to ask for it, until it exits: gunicorn starts
+    a sweeper in every worker, and only one of them should sweep
+    '''
+    def __init__(self, path: str):
+        self.path = path
+        self.file = None
+
+    def __call__(self) -> bool:
+        if self.file is None:
+            file = open(self.path, 'a')
+            try:
+                fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                file.close()
+                return False
+            self.file = file
+
+        return True
+
+
+class Sweeper:
+    '''
+    Removes old games from a StateUpdater: games never joined by two players expire, finished games are
+    moved to the archive, and started games left unfinished are purged. Without an archive, finished games are kept.
+    Games are listed and read from games, which should be the store itself rather than a cache, so that old games
+    never displace live ones. Deletes go through cache instead, if given, so it drops its copy.
+    Storage calls are spread out to at most rate per second, so sweeps never compete with live traffic.
+    Call run() on a background thread to sweep every interval seconds, whenever lease() returns True if given.
+    '''
+    def __init__(self, games: StateUpdater, logger, archive: Archive = None, policy: RetentionPolicy = None,
+                 interval: float = 3600.0, rate: float = 20.0, batch: int = 100, cache: StateUpdater = None, lease=None):
+        self.games = games
+        self.logger = logger
+        self.archive = archive
+        self.policy = policy or RetentionPolicy()
+        self.interval = interval
+        self.rate = rate
+        self.batch = batch
+        self.cache = cache or games
+        self.lease = lease
+        # Games read and kept, to when they are next due: only their own policy's age can change that
+        self.revisit = {}
+        self.stopped = threading.Event()
+
+    def throttle(self) -> bool:
+        ''' Wait for the next storage call to be due. False if stopped meanwhile '''
+        return not self.stopped.wait(1 / self.rate)
+
+    def sweep(self) -> Counter:
+        now = time.time()
+        counts = Counter()
+        policies = [self.policy.unjoined, self.policy.abandoned] + ([self.policy.finished] if self.archive else [])
+        listed = list(self.games.updated_before(now - min(policies)))
+        # Entries for games no longer listed are dropped, as they have moved or been removed since
+        self.revisit = {id: self.revisit[id] for id in listed if id in self.revisit}
+        ids = [id for id in listed if self.revisit.get(id, 0) < now]
+        if len(ids) < len(listed):
+            counts['skipped'] = len(listed) - len(ids)
+        for start in range(0, len(ids), self.batch):
+            # Finished games in a batch are archived together, before any of them is deleted
+            doomed = {}
+            for id in ids[start:start + self.batch]:
+                if not self.throttle():
+                    return counts
+
+                try:
+                    game = self.games.get(id)
+                except Exception:
+                    # Deleted since it was listed, perhaps by another instance's sweeper
+                    self.logger.debug('Skipping game %s', id)
+                    continue
+
+                action = classify(game, now, self.policy)
+                if action and (action != 'archive' or self.archive):
+                    doomed[id] = action, game
+                else:
+                    # Games only get younger by moving, so there is no need to read this one again before then
+                    self.revisit[id] = math.inf if game.finished and not self.archive else deadline(game, self.policy)
+
+            if self.archive:
+                self.archive.extend({id: game for id, (action, game) in doomed.items() if action == 'archive'})
+
+            for id, (action, game) in doomed.items():
+                if not self.throttle():
+                    return counts
+
+                try:
+                    # Only if the game has not moved since it was read
+                    self.cache.delete(id, game.version)
+                    counts[action] += 1
+                except ConflictException:
+                    counts['kept'] += 1
+
+        return counts
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        self.logger.info('Sweeping old games every %s s, at most %s storage calls per second...', self.interval, self.rate)
+        while not self.stopped.wait(self.interval):
+            if self.lease and not self.lease():
+                self.logger.debug('Another process holds the sweeper lease')
+                continue
+
+            start = time.monotonic()
+            counts = self.sweep()
+            self.logger.info('Swept games in %.1f s: %s', time.monotonic() - start, dict(counts))
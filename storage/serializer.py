@@ -1,18 +1,35 @@
-from dataclasses import fields, is_dataclass
+import base64
+from dataclasses import MISSING, fields, is_dataclass
 from enum import Enum
+from functools import cache
 from types import NoneType
 from typing import get_args, get_origin
 
+from battleship.model import BitBoard, Game, Placement, ShipType
+
 
 class SerializationException(Exception):
     pass
 
 
+primitives = (NoneType, bool, int, float, str)
+
+
 def serialize(obj):
+    return encoder(type(obj))(obj)
+
+
+def deserialize(obj, hint: type):
+    return decoder(hint)(obj)
+
+
+def serialize_value(obj):
     if isinstance(obj, (NoneType, bool, int, float, str)):
         return obj
     elif isinstance(obj, Enum):
         return obj.value
+    elif isinstance(obj, BitBoard):
+        return encode_board(obj)
     elif isinstance(obj, tuple):
         return [serialize(i) for i in obj]
     elif isinstance(obj, list):
@@ -24,24 +41,135 @@ def serialize(obj):
         return {k: serialize(d[k]) for k in d}
     
     raise SerializationException(f'Type {type(obj)} not supported')
+
+
+# Boards are stored packed: fleet placements plus a base64 peg bitmask.
+# Documents written before this format hold a list of {'row': [...]} cell dicts instead
+BOARD_FORMAT = 1
+
+
+def encode_board(board: BitBoard) -> dict:
+    size = (board.width*board.height + 7) // 8
+    return {
+        'format': BOARD_FORMAT,
+        'width': board.width,
+        'height': board.height,
+        'fleet': [
+            {'type': p.type.value, 'origin': list(p.origin), 'bearing': list(p.bearing), 'length': p.length}
+            for p in board.fleet
+        ],
+        'pegs': base64.b64encode(board.pegs.to_bytes(size, 'little')).decode('ascii')
+    }
+
+
+def decode_board(obj) -> BitBoard:
+    if isinstance(obj, list):
+        return decode_rows(obj)
+    elif obj.get('format') != BOARD_FORMAT:
+        raise SerializationException(f'Board format {obj.get("format")} not supported')
+
+    fleet = [
+        Placement(ShipType(p['type']), tuple(p['origin']), tuple(p['bearing']), p['length'])
+        for p in obj['fleet']
+    ]
+    pegs = int.from_bytes(base64.b64decode(obj['pegs']), 'little')
+    return BitBoard(obj['width'], obj['height'], fleet, pegs)
+
+
+def is_legacy(doc: dict) -> bool:
+    ''' True if a stored game document still holds boards in the row format '''
+    return any(isinstance(p['board'], list) for p in doc.get('players', []))
+
+
+def upgrade(doc: dict) -> dict:
+    ''' Rewrite a stored game document with boards in the current format '''
+    return serialize(deserialize(doc, Game))
+
+
+def decode_rows(obj) -> BitBoard:
+    # Same reconstruction as BitBoard.from_cells, reading cell dicts without building Ship views
+    lengths = {}
+    pegs = 0
+    width = len(obj[0]['row']) if obj else 0
+    for y, o in enumerate(obj):
+        for x, c in enumerate(o['row']):
+            if c['peg']:
+                pegs |= 1 << (y*width + x)
+
+            ship = c['ship']
+            if ship:
+                offset = ship['offset']
+                vx, vy = bearing = tuple(ship['bearing'])
+                key = ship['type'], (x - vx*offset, y - vy*offset), bearing
+                lengths[key] = max(lengths.get(key, 0), offset + 1)
+
+    fleet = [Placement(ShipType(type), origin, bearing, length) for (type, origin, bearing), length in lengths.items()]
+    return BitBoard(width, len(obj), fleet, pegs)
+
+
+def identity(obj):
+    return obj
+
+
+def optional(func):
+    return lambda obj: None if obj is None else func(obj)
+
+
+def is_enum(hint: type) -> bool:
+    return isinstance(hint, type) and issubclass(hint, Enum)
+
+
+@cache
+def encoder(hint: type):
+    ''' Specialised encoder for values of the given type hint, compiled on first use '''
+    if hint in primitives:
+        return identity
+    elif is_enum(hint):
+        return lambda obj: obj.value
+    elif hint is BitBoard:
+        return encode_board
+    elif get_origin(hint) == tuple and all(h in primitives for h in get_args(hint)):
+        return list
+    elif get_origin(hint) == list:
+        [h] = get_args(hint)
+        encode = optional(encoder(h))
+        if get_origin(h) == list:
+            return lambda obj: [{'row': encode(i)} for i in obj]
+        return lambda obj: [encode(i) for i in obj]
+    elif is_dataclass(hint):
+        encoders = [(f.name, optional(encoder(f.type))) for f in fields(hint)]
+        return lambda obj: {name: encode(getattr(obj, name)) for name, encode in encoders}
     
-def deserialize(obj, hint: type):
-    if isinstance(obj, NoneType):
-        return obj
-    elif hint in [bool, int, float, str]:
-        return obj
-    elif issubclass(hint, Enum):
-        return hint(obj)
+    return serialize_value
+
+
+@cache
+def decoder(hint: type):
+    ''' Specialised decoder for documents of the given type hint, compiled on first use '''
+    if hint in [bool, int, float, str]:
+        return identity
+    elif hint is BitBoard:
+        return optional(decode_board)
+    elif is_enum(hint):
+        return optional(hint)
     elif get_origin(hint) == tuple:
-        args = get_args(hint)
-        return tuple(deserialize(o, h) for o, h in zip(obj, args))
+        decoders = [decoder(h) for h in get_args(hint)]
+        return optional(lambda obj: tuple(decode(o) for decode, o in zip(decoders, obj)))
     elif get_origin(hint) == list:
         [h] = get_args(hint)
+        decode = decoder(h)
         if get_origin(h) == list:
-            return [deserialize(o['row'], h) for o in obj]
-        return [deserialize(o, h) for o in obj]
+            return optional(lambda obj: [decode(o['row']) for o in obj])
+        return optional(lambda obj: [decode(o) for o in obj])
     elif is_dataclass(hint):
-        args = fields(hint)
-        return hint(**{f.name: deserialize(obj[f.name], f.type) for f in args})
+        decoders = [(f.name, decoder(f.type)) for f in fields(hint)]
+        # Fields added since a document was written take their defaults
+        defaults = {f.name: f.default for f in fields(hint) if f.default is not MISSING}
+        return optional(lambda obj: hint(*[decode(obj[name] if name in obj else defaults[name]) for name, decode in decoders]))
+
+    def unsupported(obj):
+        if obj is None:
+            return obj
+        raise SerializationException(f'Type {hint} not supported')
     
-    raise SerializationException(f'Type {hint} not supported')
+    return unsupported
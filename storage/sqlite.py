@@ -0,0 +1,202 @@
+import json
+import sqlite3
+import threading
+
+from battleship.model import Game
+from battleship.server import Change, ConflictException, StateUpdater
+from storage.serializer import deserialize, serialize
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    player INTEGER NOT NULL,
+    updated REAL NOT NULL,
+    finished INTEGER NOT NULL,
+    message TEXT,
+    version INTEGER NOT NULL DEFAULT 0,
+    reply TEXT
+);
+CREATE TABLE IF NOT EXISTS players (
+    game INTEGER NOT NULL REFERENCES games(id),
+    seat INTEGER NOT NULL,
+    id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    board TEXT NOT NULL,
+    pegs TEXT NOT NULL,
+    sunk TEXT NOT NULL,
+    PRIMARY KEY (game, seat)
+);
+-- Retention sweeps look games up by age
+CREATE INDEX IF NOT EXISTS games_updated ON games (updated);
+'''
+
+# Game fields stored in their own column of the games table
+GAME_COLUMNS = {'player', 'updated', 'finished', 'message', 'version', 'reply'}
+
+
+def supported(change: Change) -> bool:
+    if change[0] == 'players':
+        return len(change) == 2 or list(change[2:]) in [['board', 'pegs'], ['sunk']]
+    
+    return len(change) == 1 and change[0] in GAME_COLUMNS
+
+
+def game_row(doc: dict) -> dict:
+    return {
+        'player': doc['player'],
+        'updated': doc['updated'],
+        'finished': doc['finished'],
+        'message': json.dumps(doc['message']),
+        'version': doc['version'],
+        'reply': json.dumps(doc['reply'])
+    }
+
+
+def player_row(doc: dict) -> dict:
+    # Pegs are split from the rest of the board so a shot only rewrites the peg mask
+    board = dict(doc['board'])
+    pegs = board.pop('pegs')
+    return {'id': doc['id'], 'name': doc['name'], 'board': json.dumps(board), 'pegs': pegs, 'sunk': json.dumps(doc['sunk'])}
+
+
+class SqliteUpdater(StateUpdater):
+    '''
+    Games in a SQLite database in WAL mode, safe to share between worker processes.
+    Each thread gets its own connection, and moves update only the columns in their change set.
+    '''
+    def __init__(self, path: str, timeout: float = 5.0):
+        self.path = path
+        self.timeout = timeout
+        self.local = threading.local()
+        with self.connection() as conn:
+            conn.executescript(SCHEMA)
+            columns = [column for _, column, *_ in conn.execute('PRAGMA table_info(games)')]
+            if 'version' not in columns:
+                # Databases created before games were versioned
+                conn.execute('ALTER TABLE games ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+            if 'reply' not in columns:
+                # Databases created before single-player games
+                conn.execute('ALTER TABLE games ADD COLUMN reply TEXT')
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+        
+        return conn
+
+    def exists(self, id: str) -> bool:
+        row = self.connection().execute('SELECT 1 FROM games WHERE id = ?', (int(id),)).fetchone()
+        return row is not None
+
+    def get(self, id: str) -> Game:
+        # A single statement, so the game and its players come from the same snapshot
+        rows = self.connection().execute(
+            'SELECT g.player, g.updated, g.finished, g.message, g.version, g.reply, p.id, p.name, p.board, p.pegs, p.sunk '
+            'FROM games g LEFT JOIN players p ON p.game = g.id WHERE g.id = ? ORDER BY p.seat',
+            (int(id),)
+        ).fetchall()
+        if not rows:
+            raise KeyError(id)
+
+        player, updated, finished, message, version, reply, *_ = rows[0]
+        doc = {
+            'player': player,
+            'players': [
+                {'id': pid, 'name': name, 'board': {**json.loads(board), 'pegs': pegs}, 'sunk': json.loads(sunk)}
+                for *_, pid, name, board, pegs, sunk in rows
+                if pid is not None
+            ],
+            'updated': updated,
+            'finished': bool(finished),
+            'message': json.loads(message),
+            'version': version,
+            # Rows added by the migration above hold NULL rather than JSON
+            'reply': json.loads(reply) if reply else None
+        }
+        return deserialize(doc, Game)
+
+    def updated(self, id: str) -> float:
+        row = self.connection().execute('SELECT updated FROM games WHERE id = ?', (int(id),)).fetchone()
+        if row is None:
+            raise KeyError(id)
+
+        return row[0]
+
+    def updated_before(self, timestamp: float) -> list[str]:
+        rows = self.connection().execute('SELECT id FROM games WHERE updated < ?', (timestamp,)).fetchall()
+        return [str(id) for id, in rows]
+
+    def delete(self, id: str, expected_version: int = None):
+        conn = self.connection()
+        with conn:
+            if expected_version is None:
+                conn.execute('DELETE FROM games WHERE id = ?', (int(id),))
+            elif conn.execute('DELETE FROM games WHERE id = ? AND version = ?', (int(id), expected_version)).rowcount == 0:
+                raise ConflictException(f'Game {id} is not at version {expected_version}')
+            
+            conn.execute('DELETE FROM players WHERE game = ?', (int(id),))
+
+    def insert(self, game: Game) -> str:
+        doc = serialize(game)
+        conn = self.connection()
+        with conn:
+            cursor = conn.execute(
+                'INSERT INTO games (player, updated, finished, message, version, reply) '
+                'VALUES (:player, :updated, :finished, :message, :version, :reply)',
+                game_row(doc)
+            )
+            id = cursor.lastrowid
+            for seat, player in enumerate(doc['players']):
+                self.write_player(conn, id, seat, player)
+        
+        return str(id)
+
+    def write_player(self, conn: sqlite3.Connection, id: int, seat: int, player: dict):
+        conn.execute(
+            'INSERT OR REPLACE INTO players (game, seat, id, name, board, pegs, sunk) '
+            'VALUES (:game, :seat, :id, :name, :board, :pegs, :sunk)',
+            {'game': id, 'seat': seat, **player_row(player)}
+        )
+
+    def update(self, game: Game, id: str, changes: list[Change] = None, expected_version: int = None) -> Game:
+        doc = serialize(game)
+        id = int(id)
+        conn = self.connection()
+        with conn:
+            if changes is None or not all(map(supported, changes)):
+                changes = [(c,) for c in GAME_COLUMNS] + [('players', seat) for seat in range(len(doc['players']))]
+            
+            columns = [c for c, *_ in changes if c in GAME_COLUMNS]
+            if expected_version is not None:
+                # The game row is written first, so its write lock is held for the rest of the transaction
+                assignments = ', '.join(f'{c} = :{c}' for c in columns or ['version'])
+                cursor = conn.execute(
+                    f'UPDATE games SET {assignments} WHERE id = :id AND version = :expected',
+                    {**game_row(doc), 'id': id, 'expected': expected_version}
+                )
+                if cursor.rowcount == 0:
+                    raise ConflictException(f'Game {id} is not at version {expected_version}')
+            elif columns:
+                row = game_row(doc)
+                assignments = ', '.join(f'{c} = :{c}' for c in columns)
+                conn.execute(f'UPDATE games SET {assignments} WHERE id = :id', {**row, 'id': id})
+
+            for change in changes:
+                if change[0] != 'players':
+                    continue
+                
+                _, seat, *path = change
+                row = player_row(doc['players'][seat])
+                if path == ['board', 'pegs']:
+                    conn.execute('UPDATE players SET pegs = ? WHERE game = ? AND seat = ?', (row['pegs'], id, seat))
+                elif path == ['sunk']:
+                    conn.execute('UPDATE players SET sunk = ? WHERE game = ? AND seat = ?', (row['sunk'], id, seat))
+                else:
+                    self.write_player(conn, id, seat, doc['players'][seat])
+        
+        return game
@@ -0,0 +1,199 @@
+import atexit
+from collections import OrderedDict
+from itertools import islice
+import threading
+
+from battleship.model import Game
+from battleship.server import Change, ConflictException, StateUpdater, merge
+from storage.cache import copy_game
+
+
+class Shard:
+    ''' One stripe of the in-memory tier: an LRU of games and the change sets not yet written back '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.games = OrderedDict()
+        # Game id to merged change set since its last write back, None for a full write
+        self.dirty = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+class TieredUpdater(StateUpdater):
+    '''
+    Keeps games in memory, authoritative over backend, for single-node deployments. Games are split over
+    lock-striped shards, so requests for different games rarely contend, and the least recently used clean
+    games are evicted beyond size. Updates are written back to backend by run() every interval seconds,
+    immediately when a game finishes if flush_on_finish, and on interpreter exit if flush_on_shutdown.
+    Dirty games are never evicted, so once a shard holds more than its share of size, the update that
+    dirtied one writes the shard back itself, holding writers back while the backend catches up.
+    '''
+    def __init__(self, backend: StateUpdater, logger, shards: int = 16, size: int = 4096, interval: float = 1.0,
+                 flush_on_finish: bool = True, flush_on_shutdown: bool = True):
+        self.backend = backend
+        self.logger = logger
+        self.shards = [Shard() for _ in range(shards)]
+        self.capacity = max(1, size // shards)
+        self.interval = interval
+        self.flush_on_finish = flush_on_finish
+        self.flush_on_shutdown = flush_on_shutdown
+        # Held while writing back, so write backs of a game always reach the backend in order
+        self.writing = threading.Lock()
+        self.stopped = threading.Event()
+
+    def shard(self, id: str) -> Shard:
+        return self.shards[hash(id) % len(self.shards)]
+
+    def evict(self, shard: Shard):
+        # Called with the shard locked. Dirty games stay until written back, as does the game just used
+        excess = len(shard.games) - self.capacity
+        victims = []
+        for id in islice(shard.games, len(shard.games) - 1):
+            if len(victims) >= excess:
+                break
+            if id not in shard.dirty:
+                victims.append(id)
+
+        for id in victims:
+            del shard.games[id]
+        shard.evictions += len(victims)
+
+    def fetch(self, id: str) -> Game:
+        # Returns the resident copy: callers must not let it escape unless copied
+        shard = self.shard(id)
+        with shard.lock:
+            game = shard.games.get(id)
+            if game is not None:
+                shard.hits += 1
+                shard.games.move_to_end(id)
+                return game
+            shard.misses += 1
+
+        # Loaded without the lock, so other games in the shard are served meanwhile
+        game = self.backend.get(id)
+        with shard.lock:
+            # Unless it was loaded or updated in the meantime
+            game = shard.games.setdefault(id, game)
+            self.evict(shard)
+
+        return game
+
+    def exists(self, id: str) -> bool:
+        shard = self.shard(id)
+        with shard.lock:
+            if id in shard.games:
+                return True
+
+        return self.backend.exists(id)
+
+    def get(self, id: str) -> Game:
+        return copy_game(self.fetch(id))
+
+    def updated(self, id: str) -> float:
+        return self.fetch(id).updated
+
+    def insert(self, game: Game) -> str:
+        # Written through, as the backend assigns the id
+        id = self.backend.insert(game)
+        shard = self.shard(id)
+        with shard.lock:
+            shard.games[id] = copy_game(game)
+            self.evict(shard)
+
+        return id
+
+    def update(self, game: Game, id: str, changes: list[Change] = None, expected_version: int = None) -> Game:
+        shard = self.shard(id)
+        while True:
+            # Loaded before taking the lock, so a read from the backend never holds up the shard
+            self.fetch(id)
+            with shard.lock:
+                current = shard.games.get(id)
+                if current is None:
+                    # Evicted by another game while clean, so the backend's copy is still current: fetch it again
+                    continue
+                if expected_version is not None and current.version != expected_version:
+                    raise ConflictException(f'Game {id} is not at version {expected_version}')
+
+                shard.games[id] = copy_game(game)
+                shard.games.move_to_end(id)
+                shard.dirty[id] = merge(shard.dirty.get(id, []), changes)
+                self.evict(shard)
+                backlog = list(shard.dirty) if len(shard.dirty) > self.capacity else None
+                break
+
+        if game.finished and self.flush_on_finish:
+            self.flush([id])
+        elif backlog:
+            self.flush(backlog)
+
+        return game
+
+    def updated_before(self, timestamp: float) -> list[str]:
+        resident = {}
+        for shard in self.shards:
+            with shard.lock:
+                resident.update((id, game.updated) for id, game in shard.games.items())
+
+        stored = [id for id in self.backend.updated_before(timestamp) if id not in resident]
+        return stored + [id for id, updated in resident.items() if updated < timestamp]
+
+    def delete(self, id: str, expected_version: int = None):
+        with self.writing:
+            shard = self.shard(id)
+            with shard.lock:
+                current = shard.games.get(id)
+                if current is not None and expected_version is not None and current.version != expected_version:
+                    raise ConflictException(f'Game {id} is not at version {expected_version}')
+
+            # A game not in memory is checked by the backend rather than loaded, so sweeps never evict live games
+            self.backend.delete(id, expected_version if current is None else None)
+            with shard.lock:
+                # Including a copy loaded since the check: the game is gone
+                shard.games.pop(id, None)
+                shard.dirty.pop(id, None)
+
+    def flush(self, ids: list[str] = None) -> int:
+        ''' Write dirty games back to the backend, all of them or only ids, returning how many were written '''
+        with self.writing:
+            batch = {}
+            for shard in self.shards:
+                with shard.lock:
+                    for id in list(shard.dirty) if ids is None else [id for id in ids if id in shard.dirty]:
+                        # Resident games are replaced rather than mutated, so they can be written unlocked
+                        batch[id] = shard.games[id], shard.dirty.pop(id)
+
+            for id, (game, changes) in batch.items():
+                try:
+                    self.backend.update(game, id, changes)
+                except Exception:
+                    self.logger.exception('Writing back game %s failed, retrying next flush', id)
+                    shard = self.shard(id)
+                    with shard.lock:
+                        if id in shard.games:
+                            shard.dirty[id] = None
+
+        return len(batch)
+
+    def stats(self) -> dict:
+        stats = {'size': 0, 'dirty': 0, 'hits': 0, 'misses': 0, 'evictions': 0}
+        for shard in self.shards:
+            with shard.lock:
+                for key, value in [('size', len(shard.games)), ('dirty', len(shard.dirty)), ('hits', shard.hits),
+                                   ('misses', shard.misses), ('evictions', shard.evictions)]:
+                    stats[key] += value
+
+        return stats
+
+    def stop(self):
+        self.stopped.set()
+        self.flush()
+
+    def run(self):
+        self.logger.info('Writing back updated games every %s s...', self.interval)
+        if self.flush_on_shutdown:
+            atexit.register(self.stop)
+
+        while not self.stopped.wait(self.interval):
+            self.flush()
@@ -1,40 +1,147 @@
-import queue
+import threading
 
 from tinydb import TinyDB
+from tinydb.middlewares import CachingMiddleware
+from tinydb.storages import JSONStorage
 from tinydb.table import Document
 
 from battleship.model import Game
-from battleship.server import StateUpdater
-from storage.serializer import deserialize, serialize
+from battleship.server import Change, ConflictException, StateUpdater
+from storage.serializer import deserialize, is_legacy, serialize, upgrade
     
 
 class UpdateListener:
-    def __init__(self, logger):
+    '''
+    Applies queued writes on a single thread. Writes are keyed, so a batch keeps only the latest write per key,
+    and each batch is handed to its commit function in one call.
+    '''
+    def __init__(self, logger, batch_size: int = 64, latency: float = 0.05):
         self.logger = logger
-        self.update = queue.Queue(1)
+        self.batch_size = batch_size
+        self.latency = latency
+        self.pending = {}
+        self.queued = threading.Condition()
+        # Held while a batch is applied. Readers take it too, so a write is always either pending or applied
+        self.lock = threading.RLock()
+        self.running = True
+
+    def submit(self, key, value, commit):
+        with self.queued:
+            # Only block once a full batch of other games is waiting on the writer
+            self.queued.wait_for(lambda: key in self.pending or len(self.pending) < self.batch_size)
+            self.pending[key] = commit, value
+            self.queued.notify_all()
+
+    def peek(self, key):
+        with self.queued:
+            _, value = self.pending.get(key, (None, None))
+            return value
+
+    def discard(self, key):
+        with self.queued:
+            self.pending.pop(key, None)
+            self.queued.notify_all()
+
+    def stop(self):
+        with self.queued:
+            self.running = False
+            self.queued.notify_all()
     
     def run(self):
         self.logger.info('Listening for TinyDB updates...')
-        while update := self.update.get():
-            [updated] = update()
-            self.logger.info('Applied update for game %s', updated)
+        while True:
+            with self.queued:
+                self.queued.wait_for(lambda: self.pending or not self.running)
+                if not self.running:
+                    return
+                
+                # Linger briefly so concurrent moves share one storage write
+                self.queued.wait_for(lambda: len(self.pending) >= self.batch_size, self.latency)
+
+            with self.lock:
+                with self.queued:
+                    batch, self.pending = self.pending, {}
+                    self.queued.notify_all()
+
+                commits = {}
+                for key, (commit, value) in batch.items():
+                    commits.setdefault(commit, {})[key] = value
+                for commit, values in commits.items():
+                    commit(values)
+            
+            self.logger.info('Applied updates for games %s', list(batch))
 
 
 class TinyDbUpdater(StateUpdater):
     def __init__(self, listener: UpdateListener, path: str):
-        self.db = TinyDB(path)
-        self.await_update = listener.update
+        # Reads are served from memory, and the file is only written when a batch is flushed
+        self.db = TinyDB(path, storage=CachingMiddleware(JSONStorage))
+        self.listener = listener
+        # Held from checking a game's version to queueing its write
+        self.versions = threading.Lock()
+
+    def read(self, id: str) -> dict:
+        with self.listener.lock:
+            return self.listener.peek(int(id)) or self.db.get(doc_id=int(id))
         
     def exists(self, id: str) -> bool:
-        return self.db.contains(doc_id=int(id))
+        with self.listener.lock:
+            return self.db.contains(doc_id=int(id))
     
     def get(self, id: str) -> Game:
-        return deserialize(self.db.get(doc_id=int(id)), Game)
+        return deserialize(self.read(id), Game)
     
+    def updated(self, id: str) -> float:
+        return self.read(id)['updated']
+
     def insert(self, game: Game) -> str:
-        id = self.db.insert(serialize(game))
+        with self.listener.lock:
+            id = self.db.insert(serialize(game))
+            self.db.storage.flush()
+        
         return str(id)
     
-    def update(self, game: Game, id: str) -> Game:
-        self.await_update.put(lambda: self.db.upsert(Document(serialize(game), doc_id=int(id))))
+    def check(self, id: str, expected_version: int = None) -> bool:
+        ''' Whether game id is stored, raising ConflictException unless it is at expected_version, if given '''
+        doc = self.read(id)
+        if expected_version is not None and (doc is None or doc.get('version', 0) != expected_version):
+            raise ConflictException(f'Game {id} is not at version {expected_version}')
+
+        return doc is not None
+
+    def update(self, game: Game, id: str, changes: list[Change] = None, expected_version: int = None) -> Game:
+        with self.versions:
+            self.check(id, expected_version)
+            self.listener.submit(int(id), serialize(game), self.commit)
+        
         return game
+
+    def updated_before(self, timestamp: float) -> list[str]:
+        # Queued writes are newer still, so stored timestamps are enough to pick candidates
+        with self.listener.lock:
+            return [str(doc.doc_id) for doc in self.db.all() if doc['updated'] < timestamp]
+
+    def delete(self, id: str, expected_version: int = None):
+        with self.versions, self.listener.lock:
+            if not self.check(id, expected_version):
+                return
+            
+            self.listener.discard(int(id))
+            self.db.remove(doc_ids=[int(id)])
+            self.db.storage.flush()
+
+    def commit(self, docs: dict[int, dict]):
+        for id, doc in docs.items():
+            self.db.upsert(Document(doc, doc_id=id))
+        
+        self.db.storage.flush()
+
+    def migrate(self) -> int:
+        ''' Queue upgrades for documents still holding legacy row boards, returning how many were found '''
+        with self.listener.lock:
+            legacy = [doc for doc in self.db.all() if is_legacy(doc)]
+        
+        for doc in legacy:
+            self.listener.submit(doc.doc_id, upgrade(doc), self.commit)
+
+        return len(legacy)
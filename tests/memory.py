@@ -0,0 +1,59 @@
+from collections import Counter
+
+from battleship.model import Game
+from battleship.server import ConflictException, StateUpdater
+from storage.serializer import deserialize, serialize
+
+
+class MemoryUpdater(StateUpdater):
+    def __init__(self):
+        self.docs = {}
+        self.calls = Counter()
+        # Id and change set of every update, in order
+        self.writes = []
+
+    def exists(self, id):
+        self.calls['exists'] += 1
+        return id in self.docs
+
+    def get(self, id):
+        self.calls['get'] += 1
+        return deserialize(self.docs[id], Game)
+
+    def insert(self, game):
+        self.calls['insert'] += 1
+        id = str(len(self.docs))
+        self.docs[id] = serialize(game)
+        return id
+
+    def update(self, game, id, changes=None, expected_version=None):
+        self.calls['update'] += 1
+        if expected_version is not None and self.docs[id]['version'] != expected_version:
+            raise ConflictException()
+        self.writes.append((id, changes))
+        self.docs[id] = serialize(game)
+        return game
+
+    def updated(self, id):
+        self.calls['updated'] += 1
+        return self.docs[id]['updated']
+
+    def updated_before(self, timestamp):
+        self.calls['updated_before'] += 1
+        return [id for id, doc in self.docs.items() if doc['updated'] < timestamp]
+
+    def delete(self, id, expected_version=None):
+        self.calls['delete'] += 1
+        if expected_version is not None and self.docs[id]['version'] != expected_version:
+            raise ConflictException()
+        del self.docs[id]
+
+
+class StrictUpdater(MemoryUpdater):
+    ''' Rejects change sets with a path under another, as Firestore does '''
+    def update(self, game, id, changes=None, expected_version=None):
+        for path in changes or []:
+            if any(other != path and other[:len(path)] == path for other in changes):
+                raise ValueError(f'{path} overlaps another path')
+
+        return super().update(game, id, changes, expected_version)
@@ -0,0 +1,146 @@
+from collections import Counter
+
+from flask import Flask, render_template
+
+import tailwind
+from api import STREAM_BUFFER, configure_routing
+from battleship.hub import GameHub
+from battleship.view import FragmentCache, View
+from memory import MemoryUpdater
+
+
+def started_game(updater=None, fragments=None, hub=None, app=None, **config):
+    app = app or Flask('api')
+    app.config.update(config)
+    configure_routing(app, updater or MemoryUpdater(), fragments=fragments, hub=hub)
+    first, second = app.test_client(), app.test_client()
+    first.set_cookie('player-id', 'a')
+    second.set_cookie('player-id', 'b')
+
+    game = first.post('/').headers['HX-Redirect'].rsplit('/', 1)[1]
+    first.post(f'/games/{game}', data={'player-name': 'A'}).close()
+    second.post(f'/games/{game}', data={'player-name': 'B'}).close()
+    return game, first, second
+
+
+def test_conditional_get():
+    game, first, second = started_game()
+
+    for url in [f'/games/{game}', f'/games/{game}/poll']:
+        response = second.get(url)
+        etag = response.headers['ETag']
+        not_modified = second.get(url, headers={'If-None-Match': etag})
+        other_viewer = first.get(url, headers={'If-None-Match': etag})
+
+        assert response.status_code == 200
+        assert not_modified.status_code == 304 and not not_modified.data
+        assert other_viewer.status_code == 200
+        for streamed in [other_viewer, response]:    # Streams hold request contexts, which unwind in order
+            streamed.close()
+
+
+def test_conditional_get_after_move():
+    game, first, second = started_game()
+
+    etag = second.get(f'/games/{game}').headers['ETag']
+    first.post(f'/games/{game}/target?board=1&x=0&y=0')
+    response = second.get(f'/games/{game}', headers={'If-None-Match': etag})
+
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_storage_calls_per_route():
+    updater = MemoryUpdater()
+    game, first, second = started_game(updater)
+
+    test_cases = [
+        (first.post, '/', {'insert': 1}),
+        (first.get, f'/games/{game}', {'get': 1}),
+        (first.get, f'/games/{game}/join', {'get': 1}),
+        (first.post, f'/games/{game}', {'get': 1}),   # Already joined, nothing to write
+        (second.get, f'/games/{game}/poll', {'get': 1}),
+        (first.post, f'/games/{game}/target?board=1&x=0&y=0', {'get': 1, 'update': 1}),
+        (first.post, f'/games/{game}/target?board=0&x=0&y=0', {'get': 1}),     # Own board, ignored
+    ]
+
+    for request, url, expected in test_cases:
+        updater.calls.clear()
+        request(url, data={'player-name': 'A'})
+
+        assert updater.calls == Counter(expected), url
+
+    third = first.application.test_client()
+    third.set_cookie('player-id', 'c')
+    new_game = third.post('/').headers['HX-Redirect'].rsplit('/', 1)[1]
+    updater.calls.clear()
+    third.post(f'/games/{new_game}', data={'player-name': 'C'})
+
+    assert updater.calls == Counter({'get': 1, 'update': 1})
+
+    # Against the computer, its reply is written together with the move that made it its turn
+    bot_game = third.post('/', data={'bot': 'true'}).headers['HX-Redirect'].rsplit('/', 1)[1]
+    for request, url in [(third.post, f'/games/{bot_game}'), (third.post, f'/games/{bot_game}/target?board=0&x=0&y=0')]:
+        updater.calls.clear()
+        request(url, data={'player-name': 'C'}).close()
+
+        assert updater.calls == Counter({'get': 1, 'update': 1}), url
+
+
+def test_not_modified_without_full_read():
+    updater = MemoryUpdater()
+    game, first, second = started_game(updater)
+
+    for url in [f'/games/{game}', f'/games/{game}/poll']:
+        etag = second.get(url).headers['ETag']
+        updater.calls.clear()
+        response = second.get(url, headers={'If-None-Match': etag})
+
+        assert response.status_code == 304
+        assert updater.calls == Counter({'updated': 1}), url
+
+
+def test_long_poll_answered_at_once_when_busy():
+    updater = MemoryUpdater()
+    game, first, second = started_game(updater, hub=GameHub(), LONG_POLL_WAITERS=0)
+    updated = updater.docs[game]['updated']
+
+    waiting = second.get(f'/games/{game}/poll?since={updated - 1}')     # Already changed, so no slot is needed
+    busy = second.get(f'/games/{game}/poll?since={updated}', headers={'If-None-Match': waiting.headers['ETag']})
+
+    assert b'hx-trigger="load"' in waiting.data
+    assert busy.status_code == 200 and busy.headers['ETag'] != waiting.headers['ETag']
+    assert b'hx-trigger="every' in busy.data and b'since=' not in busy.data
+    for streamed in [busy, waiting]:
+        streamed.close()
+
+
+def test_board_fragments_shared_between_viewers():
+    fragments = FragmentCache()
+    game, first, _ = started_game(fragments=fragments)
+    spectators = [first.application.test_client() for _ in range(3)]
+
+    pages = [spectators[0].get(f'/games/{game}').data]
+    misses = fragments.stats()['misses']
+    pages += [spectator.get(f'/games/{game}').data for spectator in spectators[1:]]
+    # Responses are streamed, so the shooter's board is only rendered once the body is read
+    first.post(f'/games/{game}/target?board=1&x=0&y=0').data
+    moved = spectators[0].get(f'/games/{game}').data
+
+    assert pages[0] == pages[1] == pages[2] != moved
+    assert fragments.stats()['misses'] == misses + 2    # Only the targeted board, as seen by the shooter and by spectators
+
+
+def test_streamed_page_matches_render():
+    updater, app = MemoryUpdater(), Flask('api')
+    game, first, second = started_game(updater, app=app)
+
+    response = second.get(f'/games/{game}')
+    chunks = list(response.response)
+    response.close()
+    with app.test_request_context():
+        rendered = render_template('index.html', page='state', game=game,
+                                   **View(tailwind.config).render(updater.get(game), 'b'))
+
+    assert len(rendered) > STREAM_BUFFER and len(chunks) > 1
+    assert b''.join(chunks).decode() == rendered
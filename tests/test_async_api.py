@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+quart = pytest.importorskip('quart')
+
+from async_api import configure_routing
+from battleship.async_server import AsyncGameHub
+from battleship.metrics import Metrics
+from storage.executor import ExecutorUpdater
+from memory import MemoryUpdater
+
+
+async def started_game(hub=None):
+    app = configure_routing(quart.Quart('api'), ExecutorUpdater(MemoryUpdater()), hub=hub)
+    first, second = app.test_client(), app.test_client()
+    game = (await first.post('/')).headers['HX-Redirect'].rsplit('/', 1)[1]
+    for client, name in [(first, 'A'), (second, 'B')]:
+        await client.get(f'/games/{game}')
+        await client.post(f'/games/{game}', form={'player-name': name})
+
+    return game, first, second
+
+
+def test_conditional_get():
+    async def main():
+        game, first, second = await started_game()
+        response = await second.get(f'/games/{game}')
+        not_modified = await second.get(f'/games/{game}', headers={'If-None-Match': response.headers['ETag']})
+        return response, not_modified, await response.get_data(as_text=True)
+
+    response, not_modified, page = asyncio.run(main())
+
+    assert response.status_code == 200 and 'Your move' not in page
+    assert not_modified.status_code == 304
+
+
+def test_long_poll_wakes_on_move():
+    async def main():
+        hub = AsyncGameHub()
+        game, first, second = await started_game(hub)
+        since = hub.versions[game]
+        polls = [asyncio.create_task(second.get(f'/games/{game}/poll?since={since}')) for _ in range(50)]
+        await asyncio.sleep(0.1)
+        await first.post(f'/games/{game}/target?board=1&x=0&y=0')
+        return await asyncio.gather(*polls), hub
+
+    polls, hub = asyncio.run(main())
+
+    assert {poll.status_code for poll in polls} == {200}
+    assert hub.waiters == {}
+
+
+def test_metrics_time_streamed_responses():
+    async def main():
+        metrics = Metrics()
+        app = configure_routing(quart.Quart('api'), ExecutorUpdater(MemoryUpdater()), metrics=metrics)
+        client = app.test_client()
+        game = (await client.post('/')).headers['HX-Redirect'].rsplit('/', 1)[1]
+        await (await client.get(f'/games/{game}')).get_data()
+        return await (await client.get('/metrics')).get_data(as_text=True)
+
+    text = asyncio.run(main())
+
+    assert 'battleship_request_seconds_count{method="GET",route="/games/<game>",status="200"} 1' in text
+    assert 'battleship_server_seconds_count{method="new_game"} 1' in text
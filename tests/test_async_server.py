@@ -0,0 +1,37 @@
+import asyncio
+import logging
+
+from battleship.async_server import AsyncGameServer
+from storage.executor import ExecutorUpdater
+from storage.sqlite import SqliteUpdater
+
+
+def test_moves_round_trip(tmp_path):
+    async def main():
+        server = AsyncGameServer(ExecutorUpdater(SqliteUpdater(str(tmp_path / 'games.db'))), logging.getLogger())
+        game = await server.new_game()
+        await server.join(game, 'a', 'A')
+        await server.join(game, 'b', 'B')
+        moved = await server.target(game, 1, (0, 0))
+        return game, moved, await server.get(game)
+
+    game, moved, stored = asyncio.run(main())
+
+    assert stored == moved and stored.version == 3
+    assert SqliteUpdater(str(tmp_path / 'games.db')).get(game) == stored
+
+
+def test_retries_on_conflict(tmp_path):
+    async def main():
+        server = AsyncGameServer(ExecutorUpdater(SqliteUpdater(str(tmp_path / 'games.db'))), logging.getLogger())
+        game = await server.new_game()
+        await server.join(game, 'a', 'A')
+        await server.join(game, 'b', 'B')
+        # Racing clicks, each from its own read: only the first shot lands, the rest find the turn has passed
+        stale = [await server.get(game) for _ in range(4)]
+        return await asyncio.gather(*[server.target(game, 1, (x, 0), state=state) for x, state in enumerate(stale)])
+
+    results = asyncio.run(main())
+
+    assert {state.version for state in results} == {3}
+    assert {state.players[1].board.pegs.bit_count() for state in results} == {1}
@@ -0,0 +1,15 @@
+from benchmark import compare, run
+
+
+def test_runs_every_benchmark():
+    report = run(repeat=1, number=1)
+
+    assert len(report['results']) == 12
+    assert all(result['us'] > 0 for result in report['results'].values())
+
+
+def test_compare_flags_regressions():
+    baseline = {'results': {'fast': {'us': 10.0}, 'slow': {'us': 10.0}, 'removed': {'us': 1.0}}}
+    report = {'results': {'fast': {'us': 12.0}, 'slow': {'us': 13.0}, 'added': {'us': 5.0}}}
+
+    assert compare(report, baseline, tolerance=0.25) == [('slow', 1.3)]
@@ -0,0 +1,110 @@
+import random
+
+from flask import Flask
+
+from api import configure_routing
+from battleship.bot import add, choose_target, densest, heatmap, wrecks
+from battleship.model import BitBoard, Placement, Result, ShipType
+from battleship.server import BOT, create_board, is_sunk, ships
+from memory import MemoryUpdater, StrictUpdater
+
+
+def test_bit_sliced_counts():
+    counts = []
+    for mask, times in [(0b011, 1), (0b110, 2), (0b100, 3)]:
+        add(counts, mask, times)
+
+    assert [sum((bits >> i & 1) << k for k, bits in enumerate(counts)) for i in range(3)] == [1, 3, 5]
+    assert densest(counts, 0b111) == 0b100
+    assert densest(counts, 0b011) == 0b010
+
+
+def test_targets_around_a_hit():
+    board = BitBoard(fleet=[Placement(ShipType.CARRIER, (4, 4), (1, 0), 5)])
+    board.target((5, 4))
+
+    position = choose_target(board, [])
+
+    assert position in [(4, 4), (6, 4), (5, 3), (5, 5)]
+    # Hunt mode once nothing is left unexplained
+    assert heatmap(BitBoard(), []) != []
+
+
+def test_sees_only_what_a_player_would():
+    # A sunk destroyer next to a hit cruiser, and the same pegs with the ships the other way round
+    across = BitBoard(fleet=[Placement(ShipType.DESTROYER, (0, 0), (1, 0), 2), Placement(ShipType.CRUISER, (2, 0), (1, 0), 3)])
+    down = BitBoard(fleet=[Placement(ShipType.DESTROYER, (1, 0), (1, 0), 2), Placement(ShipType.CRUISER, (0, 0), (0, 1), 3)])
+    for board in across, down:
+        for x in range(3):
+            board.target((x, 0))
+
+    assert heatmap(across, [ShipType.DESTROYER]) == heatmap(down, [ShipType.DESTROYER])
+    # Either end of the three hits may be the destroyer, but the middle is taken whichever it is
+    assert wrecks(across, [ShipType.DESTROYER]) == 0b010
+
+
+def test_sinks_every_ship():
+    rng = random.Random(0)
+    random.seed(0)
+    board, sunk = create_board(), []
+    for shots in range(1, 101):
+        position = choose_target(board, sunk, rng)
+        assert not board.is_pegged(position)
+        board.target(position)
+        if is_sunk(board, position):
+            sunk.append(board.ship_at(position).type)
+        if len(sunk) == len(ships):
+            break
+
+    assert len(sunk) == len(ships) and shots < 100
+
+
+def bot_game(updater: MemoryUpdater):
+    app = configure_routing(Flask('api'), updater)
+    client = app.test_client()
+    client.set_cookie('player-id', 'a')
+    game = client.post('/', data={'bot': 'true'}).headers['HX-Redirect'].rsplit('/', 1)[1]
+    client.post(f'/games/{game}', data={'player-name': 'A'}).close()
+    return game, client
+
+
+def test_bot_moves_after_each_target():
+    updater = MemoryUpdater()
+    game, client = bot_game(updater)
+
+    # The computer fires first, as soon as its opponent joins
+    state = updater.get(game)
+    assert [p.id for p in state.players] == [BOT, 'a'] and state.player == 1
+    assert bin(state.players[1].board.pegs).count('1') == 1
+
+    client.post(f'/games/{game}/target?board=0&x=0&y=0').close()
+    state = updater.get(game)
+    # One write for the move and the reply
+    assert state.player == 1 and state.version == 2
+    assert state.players[0].board.is_pegged((0, 0))
+    assert bin(state.players[1].board.pegs).count('1') == 2
+
+
+def test_reply_keeps_the_players_result():
+    updater = MemoryUpdater()
+    game, client = bot_game(updater)
+    fleet = updater.get(game).players[0].board.occupied
+    index = (fleet & -fleet).bit_length() - 1
+
+    response = client.post(f'/games/{game}/target?board=0&x={index % 10}&y={index // 10}')
+    state = updater.get(game)
+
+    # The first shot at a ship of two or more cells only hits it
+    assert state.message.result is Result.HIT and state.reply is not None
+    assert b'<p>Hit!</p>' in response.data and b'<p>Computer: ' in response.data
+    response.close()
+
+
+def test_join_and_reply_write_no_overlapping_paths():
+    updater = StrictUpdater()
+    game, client = bot_game(updater)
+
+    # The computer's pegs on the new seat are written with the seat
+    assert len(updater.get(game).players) == 2 and updater.calls['update'] == 1
+    client.post(f'/games/{game}/target?board=0&x=0&y=0').close()
+    assert updater.get(game).version == 2
@@ -0,0 +1,58 @@
+from battleship.model import Game, Player
+from battleship.server import create_board
+from memory import MemoryUpdater
+from storage.cache import CachingUpdater
+from storage.serializer import serialize
+
+
+def game():
+    return Game(player=0, players=[Player(id='a', name='A', board=create_board(), sunk=[])], updated=1.0)
+
+
+def test_get_hits_cache():
+    backend = MemoryUpdater()
+    cache = CachingUpdater(backend)
+    id = cache.insert(game())
+
+    first, second = cache.get(id), cache.get(id)
+
+    assert backend.calls['get'] == 0
+    assert first == second and first is not second
+    assert first.players[0].board is not second.players[0].board
+    assert cache.stats()['hits'] == 2
+
+
+def test_get_revalidates_after_ttl():
+    backend = MemoryUpdater()
+    cache = CachingUpdater(backend, ttl=0)
+    id = cache.insert(game())
+
+    cache.get(id)
+    backend.docs[id] = serialize(Game(**{**vars(game()), 'updated': 2.0}))
+    got = cache.get(id)
+
+    assert got.updated == 2.0
+    assert cache.stats()['revalidations'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_update_refreshes_cache():
+    backend = MemoryUpdater()
+    cache = CachingUpdater(backend)
+    id = cache.insert(game())
+
+    state = cache.get(id)
+    state.players[0].board.target((0, 0))
+    cache.update(Game(**{**vars(state), 'updated': 2.0}), id)
+
+    got = cache.get(id)
+
+    assert got.updated == 2.0 and got.players[0].board.is_pegged((0, 0))
+    assert backend.calls['get'] == 0
+
+
+def test_evicts_least_recently_used():
+    cache = CachingUpdater(MemoryUpdater(), size=2)
+    ids = [cache.insert(game()) for _ in range(3)]
+
+    assert list(cache.games) == ids[1:]
+    assert cache.stats()['evictions'] == 1
@@ -0,0 +1,119 @@
+import json
+import logging
+
+import pytest
+
+from battleship.bot import choose_target
+from battleship.model import Game
+from battleship.server import ConflictException, GameServer
+from storage.events import EventUpdater
+
+
+def play(updater, moves):
+    server = GameServer(updater, logging.getLogger())
+    game = server.new_game()
+    server.join(game, 'a', 'A')
+    server.join(game, 'b', 'B')
+    for i in range(moves):
+        # Players alternate, each firing at the other's board
+        server.target(game, 1 - i % 2, (i // 2 % 10, i // 20))
+
+    return game
+
+
+def kinds(path):
+    with open(path) as file:
+        return [json.loads(line)['event']['kind'] for line in file]
+
+
+def test_moves_are_events(tmp_path):
+    path = tmp_path / 'games.log'
+    events = EventUpdater(logging.getLogger(), path)
+    game = play(events, 6)
+
+    assert kinds(path) == ['snapshot', 'join', 'join'] + ['move'] * 6
+    assert events.get(game).players[1].board.pegs == 0b111
+    assert EventUpdater(logging.getLogger(), path).get(game) == events.get(game)
+
+
+def test_snapshots(tmp_path):
+    path = tmp_path / 'games.log'
+    events = EventUpdater(logging.getLogger(), path, snapshot_every=4)
+    game = play(events, 10)
+    history = list(events.replay(game))
+
+    assert kinds(path).count('snapshot') == 4
+    assert history[-1] == events.get(game)
+    assert [state.players[0].board.pegs.bit_count() for state in history[-3:]] == [4, 5, 5]
+
+
+def test_other_updates_are_snapshots(tmp_path):
+    path = tmp_path / 'games.log'
+    events = EventUpdater(logging.getLogger(), path)
+    game = play(events, 1)
+    state = events.get(game)
+    state.finished = True
+
+    events.update(state, game)
+
+    assert kinds(path)[-1] == 'snapshot'
+    assert events.get(game) == state and events.updated(game) == state.updated
+    assert not events.exists('2') and isinstance(events.get(game), Game)
+
+
+def test_conflicting_update(tmp_path):
+    events = EventUpdater(logging.getLogger(), tmp_path / 'games.log')
+    game = play(events, 0)
+    stale = events.get(game)
+    events.update(Game(**{**vars(stale), 'finished': True, 'version': stale.version + 1}), game, [('finished',)], stale.version)
+
+    with pytest.raises(ConflictException):
+        events.update(Game(**{**vars(stale), 'version': stale.version + 1}), game, [('version',)], stale.version)
+    assert events.get(game).finished
+
+
+def test_delete(tmp_path):
+    path = tmp_path / 'games.log'
+    events = EventUpdater(logging.getLogger(), path)
+    game = play(events, 2)
+
+    assert events.updated_before(events.updated(game) + 1) == [game]
+    events.delete(game, events.get(game).version)
+    reopened = EventUpdater(logging.getLogger(), path)
+
+    assert not events.exists(game) and not reopened.exists(game)
+    assert reopened.insert(Game(player=0, players=[], updated=1.0)) == '2'
+
+
+def test_replies_are_events(tmp_path):
+    path = tmp_path / 'games.log'
+    events = EventUpdater(logging.getLogger(), path)
+    server = GameServer(events, logging.getLogger(), bot=choose_target)
+    game = server.new_game(bot=True)
+    server.join(game, 'a', 'A')
+    for x in range(3):
+        server.target(game, 0, (x, 0))
+
+    assert kinds(path) == ['snapshot', 'join', 'reply'] + ['move', 'reply'] * 3
+    state = events.get(game)
+    assert state.reply is not None and state.version == 4
+    assert EventUpdater(logging.getLogger(), path).get(game) == state == list(events.replay(game))[-1]
+
+
+def test_compact(tmp_path):
+    path = tmp_path / 'games.log'
+    events = EventUpdater(logging.getLogger(), path, snapshot_every=4)
+    game, deleted = play(events, 6), play(events, 1)
+    state = events.get(game)
+    events.delete(deleted)
+
+    events.compact()
+    reopened = EventUpdater(logging.getLogger(), path)
+
+    # From the game's latest snapshot on, with the deleted game reduced to a record of its id
+    compacted = kinds(path)
+    assert compacted[0] == 'snapshot' and compacted.count('snapshot') == 1 and 'join' not in compacted
+    assert compacted[-1] == 'delete'
+    assert events.get(game) == reopened.get(game) == state
+    assert not reopened.exists(deleted)
+    assert reopened.insert(Game(player=0, players=[], updated=1.0)) == '3'
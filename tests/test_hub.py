@@ -0,0 +1,40 @@
+import asyncio
+from threading import Thread
+import time
+
+from battleship.async_server import AsyncGameHub
+from battleship.hub import GameHub
+
+
+def test_wait_returns_published_version():
+    hub = GameHub()
+    hub.publish('a', 2.0)
+
+    assert hub.wait('a', 1.0, timeout=0)
+    assert not hub.wait('a', 2.0, timeout=0)
+    assert not hub.wait('b', 1.0, timeout=0)
+
+
+def test_wait_wakes_on_publish():
+    hub = GameHub()
+    thread = Thread(target=lambda: (time.sleep(0.05), hub.publish('a', 2.0)))
+    thread.start()
+
+    assert hub.wait('a', 1.0, timeout=5)
+    thread.join()
+    assert hub.waiting == {}
+
+
+def test_async_wait_wakes_on_publish():
+    hub = AsyncGameHub()
+
+    async def main():
+        waiters = [asyncio.create_task(hub.wait('a', 1.0, timeout=5)) for _ in range(100)]
+        await asyncio.sleep(0.05)
+        hub.publish('a', 2.0)
+        return await asyncio.gather(*waiters), await hub.wait('a', 2.0, timeout=0.01)
+
+    woken, timed_out = asyncio.run(main())
+
+    assert all(woken) and not timed_out
+    assert hub.waiters == {} and hub.events == {}
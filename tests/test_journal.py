@@ -0,0 +1,82 @@
+import logging
+
+import pytest
+
+from battleship.model import Game, Player
+from battleship.server import ConflictException, create_board
+from storage.journal import JournalUpdater
+
+
+def game(updated):
+    return Game(player=0, players=[Player(id='a', name='A', board=create_board(), sunk=[])], updated=updated)
+
+
+def test_get_latest(tmp_path):
+    journal = JournalUpdater(logging.getLogger(), tmp_path / 'games.log')
+    first, second = journal.insert(game(1.0)), journal.insert(game(1.0))
+    journal.update(game(2.0), first)
+
+    assert journal.get(first).updated == 2.0
+    assert journal.get(second).updated == 1.0
+    assert journal.updated(first) == 2.0
+    assert journal.exists(second) and not journal.exists('3')
+
+
+def test_recovers_from_torn_write(tmp_path):
+    path = tmp_path / 'games.log'
+    journal = JournalUpdater(logging.getLogger(), path)
+    id = journal.insert(game(1.0))
+    journal.update(game(2.0), id)
+    with open(path, 'ab') as file:
+        file.write(b'{"id":"1","game":{"upd')
+
+    recovered = JournalUpdater(logging.getLogger(), path)
+
+    assert recovered.get(id) == journal.get(id)
+    assert recovered.insert(game(1.0)) == '2'
+
+
+def test_compact(tmp_path):
+    path = tmp_path / 'games.log'
+    journal = JournalUpdater(logging.getLogger(), path)
+    ids = [journal.insert(game(1.0)) for _ in range(3)]
+    for i in range(10):
+        journal.update(game(float(i)), ids[0])
+    expected = [journal.get(id) for id in ids]
+
+    journal.compact()
+
+    assert journal.size == journal.live_size() == path.stat().st_size
+    assert [journal.get(id) for id in ids] == expected
+    assert [JournalUpdater(logging.getLogger(), path).get(id) for id in ids] == expected
+
+
+def test_conflicting_update(tmp_path):
+    journal = JournalUpdater(logging.getLogger(), tmp_path / 'games.log')
+    id = journal.insert(game(1.0))
+    journal.update(Game(**{**vars(game(2.0)), 'version': 1}), id, expected_version=0)
+
+    with pytest.raises(ConflictException):
+        journal.update(Game(**{**vars(game(3.0)), 'version': 1}), id, expected_version=0)
+    assert journal.get(id).updated == 2.0
+    assert JournalUpdater(logging.getLogger(), tmp_path / 'games.log').index[id][3] == 1
+
+
+def test_delete(tmp_path):
+    path = tmp_path / 'games.log'
+    journal = JournalUpdater(logging.getLogger(), path)
+    first, second = journal.insert(game(1.0)), journal.insert(game(5.0))
+
+    assert journal.updated_before(2.0) == [first]
+    with pytest.raises(ConflictException):
+        journal.delete(second, expected_version=1)
+    journal.delete(second, expected_version=0)
+    # Deleted since it was read, e.g. by a sweeper elsewhere
+    for deleted in [lambda: journal.delete(second, expected_version=0), lambda: journal.update(game(6.0), second, expected_version=0)]:
+        with pytest.raises(ConflictException):
+            deleted()
+    journal.compact()
+    reopened = JournalUpdater(logging.getLogger(), path)
+
+    assert not reopened.exists(second) and reopened.exists(first)
+    assert reopened.insert(game(1.0)) == '3'
@@ -0,0 +1,46 @@
+import logging
+from threading import Thread
+
+from battleship.model import Game
+from coldstart import measure
+from storage.lazy import LazyUpdater
+from memory import MemoryUpdater
+
+
+def test_builds_backend_once():
+    built, warmed = [], []
+
+    def factory():
+        built.append(MemoryUpdater())
+        return built[-1]
+
+    lazy = LazyUpdater(factory, logging.getLogger(), warmed.append)
+    threads = [Thread(target=lazy.run) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    id = lazy.insert(Game(player=0, players=[], updated=1.0))
+
+    assert len(built) == 1 and warmed == built
+    assert lazy.get(id).updated == 1.0
+
+
+def test_retries_failed_initialization():
+    attempts = []
+
+    def factory():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ConnectionError()
+        return MemoryUpdater()
+
+    lazy = LazyUpdater(factory, logging.getLogger())
+    lazy.run()
+    id = lazy.insert(Game(player=0, players=[], updated=1.0))
+
+    assert len(attempts) == 2 and lazy.exists(id)
+
+
+def test_gcp_imports_without_firestore():
+    assert measure('gcp', {'FLASK_FIRESTORE_INIT': 'lazy'})['heavy'] == []
@@ -0,0 +1,55 @@
+from flask import Flask
+import pytest
+
+from api import configure_routing
+from battleship.metrics import Histogram, Metrics
+from storage.metered import MeteredUpdater
+from memory import MemoryUpdater
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('latency', 'Latency', ('route',), buckets=(0.1, 1.0))
+    for value in [0.05, 0.5, 0.5, 5.0]:
+        histogram.observe(value, '/')
+
+    assert histogram.samples() == [
+        'latency_bucket{route="/",le="0.1"} 1',
+        'latency_bucket{route="/",le="1.0"} 3',
+        'latency_bucket{route="/",le="+Inf"} 4',
+        'latency_sum{route="/"} 6.05',
+        'latency_count{route="/"} 4',
+    ]
+
+
+def test_metered_updater_counts_failures():
+    metrics = Metrics()
+    games = MeteredUpdater(MemoryUpdater(), metrics)
+
+    with pytest.raises(KeyError):
+        games.get('missing')
+
+    assert metrics.errors.values == {('memory', 'get', 'KeyError'): 1}
+    assert metrics.storage.values[('memory', 'get')][-1] > 0
+
+
+def test_metrics_endpoint():
+    metrics = Metrics()
+    app = configure_routing(Flask('api'), MeteredUpdater(MemoryUpdater(), metrics), metrics=metrics)
+    client = app.test_client()
+    client.set_cookie('player-id', 'a')
+    game = client.post('/').headers['HX-Redirect'].rsplit('/', 1)[1]
+    client.post(f'/games/{game}', data={'player-name': 'A'}).close()
+    response = client.get(f'/games/{game}/poll')
+    response.close()
+    client.get(f'/games/{game}/poll', headers={'If-None-Match': response.headers['ETag']}).close()
+
+    text = client.get('/metrics').get_data(as_text=True)
+
+    assert 'battleship_request_seconds_count{method="GET",route="/games/<game>/poll",status="200"} 1' in text
+    assert 'battleship_request_seconds_count{method="GET",route="/games/<game>/poll",status="304"} 1' in text
+    assert 'battleship_server_seconds_count{method="join"} 1' in text
+    assert 'battleship_storage_seconds_count{backend="memory",call="insert"} 1' in text
+    assert 'battleship_polls_total{result="changed"} 1' in text
+    assert 'battleship_polls_total{result="not_modified"} 1' in text
+    assert 'battleship_active_games 1' in text
+    assert 'battleship_cache_lookups_total{cache="fragments",result="miss"}' in text
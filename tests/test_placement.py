@@ -0,0 +1,30 @@
+from battleship.model import BitBoard
+from battleship.placement import placement_table
+from battleship.server import new_board, ships, try_add_ship
+
+
+def test_candidates():
+    table = placement_table(10, 10)
+
+    for type, length in ships.items():
+        for origin, bearing, mask in table.candidates(length):
+            board = try_add_ship(new_board(), (type, length), origin, bearing)
+
+            assert board.occupied == mask
+
+
+def test_generate():
+    table = placement_table(10, 10)
+    fleet = list(ships.items())
+
+    for _ in range(100):
+        board = table.generate(new_board(), fleet)
+
+        assert [p.type for p in board.fleet] == list(ships)
+        assert bin(board.occupied).count('1') == sum(ships.values())
+
+
+def test_generate_full_board():
+    table = placement_table(3, 3)
+
+    assert table.generate(BitBoard(3, 3), [(None, 3)]) is None
@@ -0,0 +1,31 @@
+import logging
+from threading import Thread
+
+from battleship.pool import BoardPool
+from battleship.server import create_board
+
+
+def test_take_without_worker():
+    pool = BoardPool(create_board, logging.getLogger())
+
+    board = pool.take()
+
+    assert board is not None
+    assert pool.stats() == {'available': 0, 'hits': 0, 'misses': 1}
+
+
+def test_take_from_worker():
+    pool = BoardPool(create_board, logging.getLogger(), size=8, low=2, high=4)
+    thread = Thread(target=pool.run, daemon=True)
+    thread.start()
+
+    with pool.refill:
+        assert pool.refill.wait_for(lambda: len(pool.boards) == 4, timeout=5)
+
+    boards = [pool.take() for _ in range(3)]
+    pool.stop()
+    thread.join(timeout=5)
+
+    assert len({id(b) for b in boards}) == 3
+    assert pool.hits == 3 and pool.misses == 0
+    assert len(pool.boards) <= pool.size
@@ -0,0 +1,95 @@
+from collections import Counter
+import logging
+import time
+
+from battleship.model import Game, Player
+from battleship.server import create_board
+from memory import MemoryUpdater
+from storage.archive import Archive
+from storage.cache import CachingUpdater
+from storage.retention import FileLease, RetentionPolicy, Sweeper, classify
+from storage.sqlite import SqliteUpdater
+
+
+def game(players, updated, finished=False):
+    return Game(
+        player=0,
+        players=[Player(id=str(i), name='P', board=create_board(), sunk=[]) for i in range(players)],
+        updated=updated,
+        finished=finished
+    )
+
+
+def test_classify():
+    policy = RetentionPolicy(unjoined=10, finished=20, abandoned=30)
+    test_cases = [
+        (game(1, 95), None),
+        (game(1, 85), 'expire'),
+        (game(2, 85, finished=True), None),
+        (game(2, 75, finished=True), 'archive'),
+        (game(2, 75), None),
+        (game(2, 65), 'purge'),
+    ]
+
+    for state, expected in test_cases:
+        assert classify(state, 100, policy) == expected
+
+
+def test_sweep(tmp_path):
+    db = SqliteUpdater(str(tmp_path / 'games.db'))
+    archive = Archive(tmp_path / 'archive.jsonl.gz')
+    ids = {
+        'unjoined': db.insert(game(1, 1.0)),
+        'finished': db.insert(game(2, 1.0, finished=True)),
+        'abandoned': db.insert(game(2, 1.0)),
+        'live': db.insert(game(2, 1e12)),
+    }
+    sweeper = Sweeper(db, logging.getLogger(), archive, RetentionPolicy(unjoined=1, finished=1, abandoned=1), rate=1000)
+
+    counts = sweeper.sweep()
+
+    assert counts == {'expire': 1, 'archive': 1, 'purge': 1}
+    assert [id for id in ids.values() if db.exists(id)] == [ids['live']]
+    assert [(id, state.finished) for id, state in archive.read()] == [(ids['finished'], True)]
+
+
+def test_keeps_finished_games_without_archive(tmp_path):
+    db = SqliteUpdater(str(tmp_path / 'games.db'))
+    id = db.insert(game(2, 1.0, finished=True))
+
+    Sweeper(db, logging.getLogger(), policy=RetentionPolicy(finished=1), rate=1000).sweep()
+
+    assert db.exists(id)
+
+
+def test_kept_games_are_not_read_again():
+    db = MemoryUpdater()
+    db.insert(game(2, 1.0, finished=True))
+    db.insert(game(2, time.time() - 10))
+    sweeper = Sweeper(db, logging.getLogger(), policy=RetentionPolicy(unjoined=1, finished=1, abandoned=3600), rate=1000)
+
+    sweeper.sweep()
+    db.calls.clear()
+    counts = sweeper.sweep()
+
+    # Kept for good without an archive, and not yet abandoned, respectively
+    assert counts == {'skipped': 2}
+    assert db.calls == Counter({'updated_before': 1})
+
+
+def test_deletes_through_cache():
+    backend = MemoryUpdater()
+    cache = CachingUpdater(backend)
+    old, live = cache.insert(game(1, 1.0)), backend.insert(game(1, 1e12))
+    cache.get(old)
+
+    Sweeper(backend, logging.getLogger(), policy=RetentionPolicy(unjoined=1), rate=1000, cache=cache).sweep()
+
+    assert not cache.exists(old)
+    assert cache.stats()['size'] == 0 and backend.exists(live)
+
+
+def test_file_lease(tmp_path):
+    first, second = FileLease(tmp_path / 'sweeper.lock'), FileLease(tmp_path / 'sweeper.lock')
+
+    assert first() and second() is False and first()
@@ -1,5 +1,5 @@
-from battleship.model import Board, Ship, ShipType, Status
-from storage.serializer import deserialize, serialize
+from battleship.model import BitBoard, Board, Game, Message, Placement, Player, Result, Ship, ShipType, Status
+from storage.serializer import deserialize, is_legacy, serialize, upgrade
 
 
 def ship(offset):
@@ -51,3 +51,67 @@ def test_deserialize():
         got = deserialize(serializable, hint)
 
         assert got == expected
+
+
+def bitboard():
+    fleet = [Placement(ShipType(1), (0, y), (1, 0), 5) for y in range(5)]
+    return BitBoard(5, 5, fleet, pegs=(1 << 25) - 1)
+
+
+def serialize_bitboard():
+    return {
+        'format': 1,
+        'width': 5,
+        'height': 5,
+        'fleet': [{'type': 1, 'origin': [0, y], 'bearing': [1, 0], 'length': 5} for y in range(5)],
+        'pegs': '////AQ=='
+    }
+
+
+def test_serialize_bitboard():
+    assert serialize(bitboard()) == serialize_bitboard()
+
+
+def test_deserialize_bitboard():
+    test_cases = [
+        serialize_bitboard(),
+        serialize_board()   # Legacy row format is still readable
+    ]
+
+    for serializable in test_cases:
+        got = deserialize(serializable, BitBoard)
+
+        assert got == bitboard()
+        assert got.rows() == board()
+
+
+def test_upgrade():
+    legacy = {'player': 0, 'players': [{'id': 'a', 'name': 'A', 'board': serialize_board(), 'sunk': []}], 'updated': 1.5, 'finished': False, 'message': None}
+
+    got = upgrade(legacy)
+
+    assert is_legacy(legacy) and not is_legacy(got)
+    assert got['players'][0]['board'] == serialize_bitboard()
+
+
+def test_serialize_game():
+    game = Game(
+        player=1,
+        players=[Player(id='a', name='A', board=bitboard(), sunk=[ShipType(1)])],
+        updated=1.5,
+        message=Message(result=Result.SINK, ship=ShipType(1))
+    )
+    expected = {
+        'player': 1,
+        'players': [{'id': 'a', 'name': 'A', 'board': serialize_bitboard(), 'sunk': [1]}],
+        'updated': 1.5,
+        'finished': False,
+        'message': {'result': 3, 'ship': 1},
+        'version': 0,
+        'reply': None
+    }
+    unversioned = {k: v for k, v in expected.items() if k not in ('version', 'reply')}
+
+    assert serialize(game) == expected
+    assert deserialize(expected, Game) == game
+    assert deserialize(unversioned, Game) == game
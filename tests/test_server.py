@@ -1,15 +1,20 @@
-from battleship.model import Ship
-from battleship.server import ShipType, Status, is_sunk, new_board, setup_board, try_add_ship
+from copy import deepcopy
+import logging
+
+from battleship.model import BitBoard, Game, Ship, Status
+from battleship.server import ConflictException, GameServer, ShipType, StateUpdater, is_sunk, new_board, setup_board, try_add_ship
+from storage.serializer import deserialize, serialize
 
 
 def with_ship_at(board, origin, direction, ship):
     x0, y0 = origin
     vx, vy = direction
     type, length = ship
+    rows = board.rows()
     for i in range(length):
-        board[y0+vy*i][x0+vx*i] = Status(ship=Ship(type=type, bearing=direction, offset=i), peg=False)
+        rows[y0+vy*i][x0+vx*i] = Status(ship=Ship(type=type, bearing=direction, offset=i), peg=False)
 
-    return board
+    return BitBoard.from_rows(rows)
 
 
 def test_try_add_ship():
@@ -40,7 +45,7 @@ def test_setup_board():
     cruiser = (ShipType(3), 3)
 
     def count_spaces(board, ships):
-        spaces = [cell.ship and cell.ship.type for row in board for cell in row]
+        spaces = [cell.ship and cell.ship.type for row in board.rows() for cell in row]
         return {(ship, length): spaces.count(ship) for ship, length in ships}
 
     test_cases = [
@@ -61,7 +66,7 @@ def test_is_sunk():
         px, py = position
         vx, vy = direction
         for i in range(count):
-            board[vy*i+py][vx*i+px].peg = True
+            board.target((vx*i+px, vy*i+py))
 
         return board
 
@@ -76,3 +81,86 @@ def test_is_sunk():
         got = is_sunk(board, position)
 
         assert got == expectedResult
+
+
+class RecordingUpdater(StateUpdater):
+    ''' Stores serialized games, checking each change set covers every field that differs '''
+    def __init__(self):
+        self.docs = {}
+
+    def exists(self, id):
+        return id in self.docs
+
+    def get(self, id):
+        return deserialize(self.docs[id], Game)
+
+    def insert(self, game):
+        id = str(len(self.docs))
+        self.docs[id] = serialize(game)
+        return id
+
+    def update(self, game, id, changes=None, expected_version=None):
+        if expected_version is not None and self.docs[id]['version'] != expected_version:
+            raise ConflictException()
+        
+        doc = serialize(game)
+        patched = deepcopy(self.docs[id])
+        for *path, key in changes:
+            parent = patched
+            for k in path:
+                parent = parent[k]
+            if isinstance(parent, list) and key == len(parent):
+                parent.append(doc_at(doc, [*path, key]))
+            else:
+                parent[key] = doc_at(doc, [*path, key])
+
+        assert patched == doc
+        self.docs[id] = doc
+        return game
+
+    def updated_before(self, timestamp):
+        return [id for id, doc in self.docs.items() if doc['updated'] < timestamp]
+
+    def delete(self, id, expected_version=None):
+        del self.docs[id]
+
+
+def doc_at(doc, path):
+    for key in path:
+        doc = doc[key]
+    return doc
+
+
+def test_change_sets():
+    server = GameServer(RecordingUpdater(), logging.getLogger())
+    game = server.new_game()
+    server.join(game, 'a', 'A')
+    server.join(game, 'b', 'B')
+
+    for x in range(10):
+        for y in range(10):
+            for board in [1, 0]:
+                if not server.get(game).finished:
+                    server.target(game, board, (x, y))
+
+    assert server.get(game).finished
+
+
+def test_retries_on_conflict():
+    updater = RecordingUpdater()
+    server = GameServer(updater, logging.getLogger())
+    game = server.new_game()
+    server.join(game, 'a', 'A')
+    stale = server.get(game)
+    server.join(game, 'b', 'B')
+
+    # A racing join finds both seats taken on retry
+    assert server.join(game, 'c', 'C', state=stale) == server.get(game)
+
+    stale = server.get(game)
+    server.target(game, 1, (0, 0))
+    got = server.target(game, 1, (1, 0), state=stale)
+
+    # A racing second shot finds it is no longer the shooter's turn
+    assert got.players[1].board.pegs == 1 and got.version == 3
+    assert [p.id for p in server.get(game).players] == ['a', 'b']
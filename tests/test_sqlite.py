@@ -0,0 +1,66 @@
+import logging
+
+import pytest
+
+from battleship.model import Game
+from battleship.server import ConflictException, GameServer
+from storage.sqlite import SqliteUpdater
+
+
+def test_moves_round_trip(tmp_path):
+    db = SqliteUpdater(str(tmp_path / 'games.db'))
+    server = GameServer(db, logging.getLogger())
+    game = server.new_game()
+    server.join(game, 'a', 'A')
+    server.join(game, 'b', 'B')
+
+    for y in range(10):
+        for x in range(10):
+            for board in [1, 0]:
+                state = server.get(game)
+                if not state.finished:
+                    expected = server.target(game, board, (x, y))
+
+                    assert server.get(game) == expected
+
+    reopened = SqliteUpdater(str(tmp_path / 'games.db'))
+    assert reopened.get(game).finished
+    assert reopened.updated(game) == server.get(game).updated
+    assert reopened.exists(game) and not reopened.exists('2')
+
+
+def test_full_update(tmp_path):
+    db = SqliteUpdater(str(tmp_path / 'games.db'))
+    server = GameServer(db, logging.getLogger())
+    game = server.new_game()
+    state = server.join(game, 'a', 'A')
+    state.players[0].name = 'Renamed'
+
+    db.update(state, game)
+
+    assert db.get(game) == state
+
+
+def test_conflicting_update(tmp_path):
+    first, second = SqliteUpdater(str(tmp_path / 'games.db')), SqliteUpdater(str(tmp_path / 'games.db'))
+    server = GameServer(first, logging.getLogger())
+    game = server.new_game()
+    state = server.join(game, 'a', 'A')
+    moved = Game(**{**vars(state), 'updated': 2.0, 'version': 2})
+
+    second.update(moved, game, [('updated',), ('version',)], 1)
+
+    with pytest.raises(ConflictException):
+        first.update(Game(**{**vars(state), 'version': 2}), game, [('version',)], 1)
+    assert first.get(game) == moved
+
+
+def test_missing_game(tmp_path):
+    db = SqliteUpdater(str(tmp_path / 'games.db'))
+
+    for read in [db.get, db.updated]:
+        with pytest.raises(KeyError):
+            read('1')
+    # Sweeps search by age rather than scanning every game
+    [(plan,)] = [row[3:] for row in db.connection().execute('EXPLAIN QUERY PLAN SELECT id FROM games WHERE updated < 1')]
+    assert 'games_updated' in plan
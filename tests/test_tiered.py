@@ -0,0 +1,137 @@
+import logging
+import pytest
+
+from battleship.model import Game, Player
+from battleship.server import ConflictException, create_board, merge
+from memory import MemoryUpdater, StrictUpdater
+from storage.serializer import deserialize
+from storage.tiered import TieredUpdater
+
+
+def game():
+    return Game(player=0, players=[Player(id='a', name='A', board=create_board(), sunk=[])], updated=1.0)
+
+
+def move(tier, id, position, finished=False):
+    state = tier.get(id)
+    state.players[0].board.target(position)
+    state.version += 1
+    state.finished = finished
+    return tier.update(state, id, [('players', 0, 'board', 'pegs'), ('version',)], state.version - 1)
+
+
+def test_get_stays_in_memory():
+    backend = MemoryUpdater()
+    tier = TieredUpdater(backend, logging.getLogger())
+    id = tier.insert(game())
+
+    first, second = tier.get(id), tier.get(id)
+
+    assert backend.calls['get'] == 0
+    assert first == second and first.players[0].board is not second.players[0].board
+
+
+def test_writes_back_coalesced_updates():
+    backend = MemoryUpdater()
+    tier = TieredUpdater(backend, logging.getLogger())
+    id = tier.insert(game())
+
+    for x in range(3):
+        move(tier, id, (x, 0))
+
+    assert backend.writes == []
+    assert tier.flush() == 1
+    assert backend.writes == [(id, [('players', 0, 'board', 'pegs'), ('version',)])]
+    assert deserialize(backend.docs[id], Game) == tier.get(id)
+    assert tier.flush() == 0
+
+
+def test_flushes_finished_games():
+    backend = MemoryUpdater()
+    tier = TieredUpdater(backend, logging.getLogger())
+    id = tier.insert(game())
+
+    move(tier, id, (0, 0), finished=True)
+
+    assert deserialize(backend.docs[id], Game).finished
+    assert tier.stats()['dirty'] == 0
+
+
+def test_keeps_dirty_games_until_written_back():
+    backend = MemoryUpdater()
+    tier = TieredUpdater(backend, logging.getLogger(), shards=1, size=2)
+    ids = [tier.insert(game()) for _ in range(2)]
+    move(tier, ids[0], (0, 0))
+    move(tier, ids[1], (0, 0))
+
+    tier.insert(game())
+    assert tier.stats()['size'] == 3 and tier.stats()['evictions'] == 0
+
+    tier.flush()
+    tier.insert(game())
+    assert tier.stats()['size'] == 2 and tier.stats()['evictions'] == 2
+    assert tier.get(ids[1]).players[0].board.is_pegged((0, 0))
+
+
+def test_conflicting_update():
+    tier = TieredUpdater(MemoryUpdater(), logging.getLogger())
+    id = tier.insert(game())
+    stale = tier.get(id)
+
+    move(tier, id, (0, 0))
+    with pytest.raises(ConflictException):
+        tier.update(stale, id, None, stale.version)
+
+
+def test_delete():
+    backend = MemoryUpdater()
+    tier = TieredUpdater(backend, logging.getLogger())
+    id = tier.insert(game())
+    move(tier, id, (0, 0))
+
+    tier.delete(id, 1)
+    tier.flush()
+
+    assert not tier.exists(id) and id not in backend.docs
+
+
+def test_merge_collapses_overlapping_paths():
+    seat, pegs = ('players', 1), ('players', 1, 'board', 'pegs')
+
+    assert merge([seat, ('version',)], [pegs, ('version',)]) == [seat, ('version',)]
+    assert merge([pegs, ('version',)], [seat]) == [('version',), seat]
+    assert merge([pegs], None) is None
+
+
+def test_writes_back_join_and_move_together():
+    backend = StrictUpdater()
+    tier = TieredUpdater(backend, logging.getLogger())
+    id = tier.insert(game())
+    joined = tier.get(id)
+    joined.players.append(Player(id='b', name='B', board=create_board(), sunk=[]))
+    joined.version += 1
+    tier.update(joined, id, [('players', 1), ('version',)], 0)
+
+    # Fired at the new seat before the join was written back
+    moved = tier.get(id)
+    moved.players[1].board.target((0, 0))
+    moved.version += 1
+    tier.update(moved, id, [('players', 1, 'board', 'pegs'), ('version',)], 1)
+    tier.flush()
+
+    assert backend.writes == [(id, [('players', 1), ('version',)])]
+    assert deserialize(backend.docs[id], Game) == tier.get(id)
+
+
+def test_writes_back_when_too_many_games_are_dirty():
+    backend = MemoryUpdater()
+    tier = TieredUpdater(backend, logging.getLogger(), shards=1, size=2)
+    ids = [tier.insert(game()) for _ in range(3)]
+
+    for id in ids[:2]:
+        move(tier, id, (0, 0))
+    assert backend.writes == []
+
+    move(tier, ids[2], (0, 0))
+    assert sorted(id for id, _ in backend.writes) == ids
+    assert tier.stats()['dirty'] == 0
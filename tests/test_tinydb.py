@@ -0,0 +1,82 @@
+import json
+import logging
+from threading import Thread
+
+import pytest
+
+from battleship.model import Game
+from battleship.server import ConflictException
+from storage.tinydb import TinyDbUpdater, UpdateListener
+
+
+def game(updated):
+    return Game(player=0, players=[], updated=updated)
+
+
+def test_reads_own_writes_before_commit(tmp_path):
+    listener = UpdateListener(logging.getLogger())
+    db = TinyDbUpdater(listener, tmp_path / 'games.json')
+    id = db.insert(game(1.0))
+
+    db.update(game(2.0), id)
+
+    assert db.get(id).updated == 2.0
+    assert db.updated(id) == 2.0
+
+
+def test_coalesces_updates(tmp_path):
+    path = tmp_path / 'games.json'
+    listener = UpdateListener(logging.getLogger())
+    db = TinyDbUpdater(listener, path)
+    commits = []
+    ids = [db.insert(game(1.0)) for _ in range(2)]
+
+    def commit(docs):
+        commits.append(dict(docs))
+        db.commit(docs)
+
+    for i in range(10):
+        for id in ids:
+            listener.submit(int(id), {'player': 0, 'players': [], 'updated': float(i), 'finished': False, 'message': None}, commit)
+    thread = Thread(target=listener.run)
+    thread.start()
+    while listener.peek(int(ids[0])):
+        pass
+    listener.stop()
+    thread.join()
+
+    assert len(commits) == 1 and list(commits[0]) == [int(id) for id in ids]
+    assert [doc['updated'] for doc in json.loads(path.read_text())['_default'].values()] == [9.0, 9.0]
+
+
+def test_conflicting_update(tmp_path):
+    db = TinyDbUpdater(UpdateListener(logging.getLogger()), tmp_path / 'games.json')
+    id = db.insert(game(1.0))
+    db.update(Game(player=0, players=[], updated=2.0, version=1), id, expected_version=0)
+
+    with pytest.raises(ConflictException):
+        db.update(Game(player=0, players=[], updated=3.0, version=1), id, expected_version=0)
+    assert db.get(id).updated == 2.0
+
+
+def test_delete_discards_pending_write(tmp_path):
+    listener = UpdateListener(logging.getLogger())
+    db = TinyDbUpdater(listener, tmp_path / 'games.json')
+    id = db.insert(game(1.0))
+    db.update(Game(player=0, players=[], updated=2.0, version=1), id)
+
+    assert db.updated_before(1.5) == [id]
+    db.delete(id, expected_version=1)
+
+    assert not db.exists(id) and listener.peek(int(id)) is None
+
+
+def test_deleted_game_conflicts(tmp_path):
+    db = TinyDbUpdater(UpdateListener(logging.getLogger()), tmp_path / 'games.json')
+    id = db.insert(game(1.0))
+    db.delete(id)
+
+    for write in [lambda: db.update(game(2.0), id, expected_version=0), lambda: db.delete(id, expected_version=0)]:
+        with pytest.raises(ConflictException):
+            write()
+    db.delete(id)
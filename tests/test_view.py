@@ -0,0 +1,17 @@
+import random
+
+import tailwind
+from battleship.server import create_board
+from battleship.view import View
+
+
+def test_table_matches_per_cell_rendering():
+    random.seed(0)
+    board = create_board()
+    for x in range(0, 10, 3):
+        for y in range(10):
+            board.target((x, y))
+
+    for board_view in View(tailwind.config).boards.values():
+        per_cell = [[board_view.view_cell(ship, peg) for ship, peg in row] for row in board.cells()]
+        assert board_view.view_rows(board) == per_cell